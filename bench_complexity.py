@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import argparse
+
+# Add the src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.complexity import ComplexityClassifier
+
+# Questions labelled with the tier their correct SQL needs (see complexity_from_sql)
+LABELLED_QUESTIONS = [
+    ("Show me all customers", "simple"),
+    ("What is the most expensive product?", "simple"),
+    ("List products in the Books category", "simple"),
+    ("همه مشتریان را نشان بده", "simple"),
+    ("گران‌ترین محصول کدام است؟", "simple"),
+    ("How many customers registered last month?", "medium"),
+    ("What is the average product price?", "medium"),
+    ("Count orders by status", "medium"),
+    ("تعداد سفارش‌های لغو شده چقدر است؟", "medium"),
+    ("میانگین قیمت محصولات چقدر است؟", "medium"),
+    ("تعداد مشتریانی که ماه گذشته ثبت نام کرده‌اند", "medium"),
+    ("Total quantity ordered per customer along with their names", "complex"),
+    ("Top 5 customers by total spend", "complex"),
+    ("Which customers have never ordered a product that costs more than the average price?", "complex"),
+    ("Compare monthly revenue per category for this year", "complex"),
+    ("مجموع فروش به تفکیک دسته‌بندی برای هر ماه", "complex"),
+    ("مشتریانی که بیشتر از میانگین خرید کرده‌اند به همراه تعداد سفارش‌هایشان", "complex"),
+    ("برترین محصولات بر اساس درآمد در هر دسته", "complex"),
+]
+
+
+def legacy_complexity(question):
+    """The substring heuristic analyze_complexity_node used before the classifier"""
+    question = question.lower()
+    complex_indicators = [
+        "join", "aggregate", "sum", "average", "count", "group by",
+        "subquery", "nested", "window", "rank", "partition", "having"
+    ]
+    complex_count = sum(1 for indicator in complex_indicators if indicator in question)
+    if complex_count >= 3:
+        return "complex"
+    if complex_count >= 1:
+        return "medium"
+    return "simple"
+
+
+def accuracy(predict, questions):
+    hits = sum(1 for question, label in questions if predict(question) == label)
+    return hits / len(questions)
+
+
+def per_question_us(func, questions, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func(questions)
+    return (time.perf_counter() - start_time) / (repeat * len(questions)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the complexity classifier with the legacy heuristic')
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    classifier = ComplexityClassifier()
+    english = [item for item in LABELLED_QUESTIONS if item[0].isascii()]
+    persian = [item for item in LABELLED_QUESTIONS if not item[0].isascii()]
+    questions = [question for question, _ in LABELLED_QUESTIONS]
+
+    def classify(question):
+        return classifier.classify(question).complexity
+
+    print(f"{'':<24}{'legacy':>10}{'classifier':>12}")
+    for name, subset in (("accuracy (all)", LABELLED_QUESTIONS), ("accuracy (English)", english),
+                         ("accuracy (Persian)", persian)):
+        print(f"{name:<24}{accuracy(legacy_complexity, subset):>10.0%}{accuracy(classify, subset):>12.0%}")
+
+    legacy_us = per_question_us(lambda batch: [legacy_complexity(q) for q in batch], questions, args.repeat)
+    single_us = per_question_us(lambda batch: [classifier.classify(q) for q in batch], questions, args.repeat)
+    batch_us = per_question_us(classifier.classify_many, questions, args.repeat)
+    print(f"\n{'us/question':<24}{legacy_us:>10.1f}{single_us:>12.1f}  (batched: {batch_us:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import sys
+import os
+import re
+import json
+import time
+import argparse
+
+# Add the src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.sql_extraction import extract_sql_query
+
+# Representative sqlcoder:7b responses; pass --corpus to benchmark logged raw responses instead
+CORPUS = [
+    "SELECT name, price FROM core_product ORDER BY price DESC LIMIT 1;",
+    "SELECT COUNT(*) FROM core_customer WHERE registration_date >= CURRENT_DATE - INTERVAL '1 month';",
+    "```sql\nSELECT c.name, SUM(o.quantity) AS total\nFROM core_customer c\nJOIN core_order o ON o.customer_id = c.id\nGROUP BY c.name\nORDER BY total DESC\nLIMIT 5;\n```",
+    "Here's the query you asked for:\n\n```sql\nSELECT category, AVG(price) FROM core_product GROUP BY category;\n```\n\nThis groups products by category and averages the price.",
+    "SELECT name FROM core_product WHERE price > (SELECT AVG(price) FROM core_product)",
+    "-- most recent orders\nSELECT id, order_date, status FROM core_order ORDER BY order_date DESC LIMIT 10;\n-- end",
+    "To answer this we need to select the customers with the most orders. The query below joins the tables:\n"
+    "SELECT c.name, COUNT(o.id) AS orders FROM core_customer c JOIN core_order o ON o.customer_id = c.id "
+    "GROUP BY c.name ORDER BY orders DESC LIMIT 1\n\nNote: ties are broken arbitrarily.",
+    "WITH monthly AS (SELECT date_trunc('month', order_date) AS month, SUM(quantity) AS qty FROM core_order GROUP BY 1)\n"
+    "SELECT month, qty FROM monthly ORDER BY month;",
+    "SELECT status, COUNT(*) FROM core_order WHERE status <> 'cancelled; really' GROUP BY status;",
+]
+
+
+def legacy_extract_sql_query(text):
+    """The regex cascade extract_sql_query used before the shared scanner"""
+    text = re.sub(r'```sql|```', '', text)
+    sql_patterns = [
+        r'(SELECT.*?;)',
+        r'(SELECT.*?)(?=SELECT|$)',
+        r'(SELECT.*?FROM.*?WHERE.*?)',
+        r'(SELECT.*?FROM.*?)',
+    ]
+    for pattern in sql_patterns:
+        matches = re.findall(pattern, text, re.IGNORECASE | re.DOTALL)
+        if matches:
+            query = matches[0].strip()
+            if not query.endswith(';'):
+                query += ';'
+            return query
+    cleaned_text = re.sub(r'[^a-zA-Z0-9\s_,.*=()\'\-\+]', ' ', text).strip()
+    if cleaned_text and any(word in cleaned_text.upper() for word in ['SELECT', 'FROM', 'WHERE']):
+        if not cleaned_text.endswith(';'):
+            cleaned_text += ';'
+        return cleaned_text
+    return text.strip()
+
+
+def rambling_output(size):
+    """A long answer that keeps mentioning 'select' without ever terminating a statement"""
+    filler = "We could select from the orders table, or select the products first, then decide. "
+    return filler * size + "SELECT id FROM core_order"
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as corpus_file:
+        if path.endswith('.jsonl'):
+            return [json.loads(line)['response'] for line in corpus_file if line.strip()]
+        return json.load(corpus_file)
+
+
+def bench(func, corpus, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            func(text)
+    return (time.perf_counter() - start_time) / (repeat * len(corpus)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQL extraction from model output')
+    parser.add_argument('--corpus', help='JSON list or JSONL file ({"response": ...} per line) of raw model outputs')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else CORPUS
+
+    print(f"{'corpus':<24}{'legacy us/op':>14}{'scanner us/op':>15}")
+    print(f"{'model outputs':<24}{bench(legacy_extract_sql_query, corpus, args.repeat):>14.1f}"
+          f"{bench(extract_sql_query, corpus, args.repeat):>15.1f}")
+
+    for size in (10, 100, 1000):
+        rambling = [rambling_output(size)]
+        repeat = max(1, args.repeat // size)
+        print(f"{f'rambling x{size}':<24}{bench(legacy_extract_sql_query, rambling, repeat):>14.1f}"
+              f"{bench(extract_sql_query, rambling, repeat):>15.1f}")
+
+    changed = [text for text in corpus if legacy_extract_sql_query(text) != extract_sql_query(text)]
+    print(f"\n{len(changed)} of {len(corpus)} outputs extract differently:")
+    for text in changed:
+        print(f"- legacy:  {legacy_extract_sql_query(text)!r}\n  scanner: {extract_sql_query(text)!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,7 @@ python /app/wait_for_db.py
 # Change to src directory and run Django commands
 cd /app/src
 python manage.py migrate
+python manage.py createcachetable
 python manage.py seed_db
+python manage.py refresh_rollups
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -3,6 +3,8 @@ import json
 import re
 import logging
 from django.db import connection
+from .sql_validator import validate_sql
+from . import sql_extraction
 logger = logging.getLogger(__name__)
 
 class QueryCraftAgent:
@@ -71,13 +73,8 @@ class QueryCraftAgent:
             # Extract SQL query from the response
             sql_query = self.extract_sql_query(raw_response)
             
-            # Validate it's a SELECT statement
-            if not sql_query.upper().startswith('SELECT'):
-                raise ValueError("Generated query is not a SELECT statement")
-                
-            # Additional validation
-            if any(keyword in sql_query.upper() for keyword in ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'ALTER', 'CREATE']):
-                raise ValueError("Generated query contains unauthorized SQL operations")
+            # Validate it's a single read-only SELECT statement
+            validate_sql(sql_query)
                 
             return sql_query
         except Exception as e:
@@ -88,35 +85,10 @@ class QueryCraftAgent:
         """
         Extract SQL query from model response, which might contain extra text
         """
-        # Remove any markdown code blocks
-        text = re.sub(r'```sql|```', '', text)
-        
-        # Look for SQL statements
-        sql_patterns = [
-            r'(SELECT.*?;)',  # SELECT statements ending with ;
-            r'(SELECT.*?)(?=SELECT|$)',  # SELECT statements without ;
-            r'(SELECT.*?FROM.*?WHERE.*?)',  # SELECT with WHERE
-            r'(SELECT.*?FROM.*?)',  # Basic SELECT
-        ]
-        
-        for pattern in sql_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.DOTALL)
-            if matches:
-                # Clean up the query
-                query = matches[0].strip()
-                # Ensure it ends with a semicolon
-                if not query.endswith(';'):
-                    query += ';'
-                return query
-        
-        # If no SQL pattern found, try to clean up and return the whole text
-        cleaned_text = re.sub(r'[^a-zA-Z0-9\s_,.*=()\']', ' ', text).strip()
-        if cleaned_text and any(word in cleaned_text.upper() for word in ['SELECT', 'FROM', 'WHERE']):
-            if not cleaned_text.endswith(';'):
-                cleaned_text += ';'
-            return cleaned_text
-        
-        raise ValueError("No valid SQL query found in the model response")
+        sql_query = sql_extraction.extract_sql_query(text)
+        if sql_query is None:
+            raise ValueError("No valid SQL query found in the model response")
+        return sql_query
     
     def validate_and_correct_sql(self, sql_query):
         """
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import pickle
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+
+from .targets import get_target
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " ?!.;؟"
+
+# Payloads smaller than this are stored uncompressed; zlib costs more than it saves on tiny results
+COMPRESS_MIN_BYTES = 1024
+_RAW = b"r"
+_ZLIB = b"z"
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, whitespace and trailing punctuation so trivially different phrasings share an entry"""
+    question = _WHITESPACE_RE.sub(" ", question.strip().lower())
+    return question.rstrip(_TRAILING_PUNCTUATION)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def pack_rows(rows: List[Dict]) -> bytes:
+    """Column-oriented, optionally compressed encoding: column names are stored once, not once per row"""
+    columns = list(rows[0]) if rows else []
+    data = pickle.dumps((columns, [tuple(row.values()) for row in rows]), pickle.HIGHEST_PROTOCOL)
+    if len(data) < COMPRESS_MIN_BYTES:
+        return _RAW + data
+    return _ZLIB + zlib.compress(data, 6)
+
+
+def unpack_rows(payload: bytes) -> List[Dict]:
+    data = payload[1:]
+    if payload[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    columns, values = pickle.loads(data)
+    return [dict(zip(columns, row)) for row in values]
+
+
+class AnswerCache:
+    """Question -> SQL and SQL -> rows caches, keyed by the target's current schema fingerprint"""
+
+    def __init__(self, alias: Optional[str] = None, enabled: bool = True):
+        self.alias = alias or settings.QUERYCRAFT_CACHE_ALIAS
+        self.enabled = enabled
+
+    @property
+    def cache(self):
+        # caches[] is per thread, so look it up on every use rather than holding one connection
+        return caches[self.alias]
+
+    def _key(self, namespace: str, text: str, target: Optional[str] = None) -> str:
+        return f"qc:{namespace}:{get_target(target).fingerprint()}:{_digest(text)}"
+
+    def get_sql(self, question: str, target: Optional[str] = None) -> Optional[str]:
+        return self._get("sql", normalize_question(question), target)
+
+    def set_sql(self, question: str, sql_query: str, target: Optional[str] = None):
+        self._set("sql", normalize_question(question), target, sql_query, settings.QUERYCRAFT_SQL_CACHE_TTL)
+
+    def get_result(self, sql_query: str, target: Optional[str] = None) -> Optional[Tuple[List[Dict], float]]:
+        """Cached rows of sql_query and when they were read from the database
+
+        Nothing invalidates them when the data changes; they are only as
+        fresh as QUERYCRAFT_RESULT_CACHE_TTL allows.
+        """
+        entry = self._get("result", sql_query.strip(), target)
+        if entry is None:
+            return None
+        try:
+            cached_at, payload = entry
+            return unpack_rows(payload), cached_at
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached result: {str(e)}")
+            return None
+
+    def set_result(self, sql_query: str, rows: List[Dict], target: Optional[str] = None):
+        payload = pack_rows(rows)
+        # One huge result would push out hundreds of small, frequently reused ones
+        if len(payload) > settings.QUERYCRAFT_CACHE_MAX_ITEM_BYTES:
+            logger.info(f"Result of {len(payload)} bytes is too large to cache")
+            return
+        self._set("result", sql_query.strip(), target, (time.time(), payload), settings.QUERYCRAFT_RESULT_CACHE_TTL)
+
+    def _get(self, namespace: str, text: str, target: Optional[str]):
+        if not self.enabled:
+            return None
+        # A cache outage should cost latency, never the answer
+        try:
+            return self.cache.get(self._key(namespace, text, target))
+        except Exception as e:
+            logger.warning(f"Answer cache read failed: {str(e)}")
+            return None
+
+    def _set(self, namespace: str, text: str, target: Optional[str], value, ttl: int):
+        if not self.enabled or ttl <= 0:
+            return
+        try:
+            self.cache.set(self._key(namespace, text, target), value, ttl)
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {str(e)}")
@@ -0,0 +1,298 @@
+import math
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .sql_validator import KEYWORDS, parse_sql, split_top_level, token_text
+
+logger = logging.getLogger(__name__)
+
+# Two-sided 95% normal interval
+CONFIDENCE = 0.95
+_Z = 1.96
+
+_AGGREGATES = frozenset(["COUNT", "SUM", "AVG"])
+
+# Anything that makes a scaled sample answer wrong rather than merely imprecise
+_UNSUPPORTED = frozenset(["JOIN", "UNION", "INTERSECT", "EXCEPT", "DISTINCT", "HAVING", "ORDER", "LIMIT",
+                          "OFFSET", "FETCH", "OVER", "WINDOW", "WITH", "TABLESAMPLE", "MIN", "MAX"])
+
+
+class Aggregate(NamedTuple):
+    function: str            # COUNT, SUM or AVG
+    argument: Optional[str]  # None for COUNT(*)
+    name: str                # output column name
+
+
+class ApproximatePlan(NamedTuple):
+    table: str
+    select_items: Tuple      # ("group", text) or ("aggregate", Aggregate), in select-list order
+    from_clause: str         # table with its alias, where TABLESAMPLE goes
+    where_clause: str
+    group_clause: str
+
+    @property
+    def aggregates(self) -> List[Aggregate]:
+        return [item for kind, item in self.select_items if kind == "aggregate"]
+
+    @property
+    def sample_method(self) -> str:
+        """BERNOULLI picks rows independently, which the error bounds assume; SYSTEM picks whole pages
+
+        A filter usually selects rows that sit together on disk (core_order is
+        laid out by order_date), where page sampling is far noisier than the
+        bounds say. Unfiltered aggregates keep the cheaper page sample.
+        """
+        return "BERNOULLI" if self.where_clause else "SYSTEM"
+
+    @property
+    def is_table_count(self) -> bool:
+        """A bare COUNT(*) of the whole table, answered from planner statistics"""
+        return (not self.where_clause and not self.group_clause and len(self.select_items) == 1
+                and self.aggregates and self.aggregates[0].argument is None)
+
+
+def _without_alias(item):
+    """Select item tokens minus a trailing `AS name` or implicit `name` alias"""
+    if len(item) > 2 and item[-2].upper == "AS":
+        return item[:-2]
+    last, before = item[-1], item[-2] if len(item) > 1 else None
+    if (before is not None and last.kind in ("word", "qident") and last.upper not in KEYWORDS
+            and (before.kind in ("word", "qident", "number", "string") or before.value == ")")):
+        return item[:-1]
+    return item
+
+
+def plan_approximation(sql_query: str) -> Tuple[Optional[ApproximatePlan], Optional[str]]:
+    """Plan for estimating sql_query from a sample, or (None, why it must run exactly)
+
+    Eligible queries read one table and select only COUNT/SUM/AVG aggregates,
+    optionally grouped by plain columns.
+    """
+    parsed = parse_sql(sql_query)
+    tokens = [token for token in parsed.tokens if token.value != ";"]
+    if parsed.statement_type != "SELECT" or parsed.statement_count != 1:
+        return None, "only single SELECT statements can be approximated"
+    if len(parsed.tables) != 1:
+        return None, "only single-table queries can be approximated"
+
+    words = {token.upper for token in tokens}
+    unsupported = sorted(words & _UNSUPPORTED)
+    if unsupported:
+        return None, f"{unsupported[0]} cannot be approximated from a sample"
+    if sum(1 for token in tokens if token.upper == "SELECT") > 1:
+        return None, "subqueries cannot be approximated"
+
+    # Clause boundaries at the top level
+    clauses, depth = {}, 0
+    for index, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.upper in ("SELECT", "FROM", "WHERE", "GROUP") and token.upper not in clauses:
+            clauses[token.upper] = index
+    if "FROM" not in clauses:
+        return None, "query has no FROM clause"
+
+    order = sorted(clauses.items(), key=lambda item: item[1])
+    bounds = {name: (start + 1, order[i + 1][1] if i + 1 < len(order) else len(tokens))
+              for i, (name, start) in enumerate(order)}
+
+    from_tokens = tokens[slice(*bounds["FROM"])]
+    if any(token.value == "," for token in from_tokens):
+        return None, "only single-table queries can be approximated"
+
+    group_tokens = tokens[slice(*bounds["GROUP"])][1:] if "GROUP" in bounds else []
+
+    select_items, expressions = [], []
+    for item in split_top_level(tokens[slice(*bounds["SELECT"])]):
+        if not item:
+            return None, "empty select item"
+        expressions.append(token_text(sql_query, _without_alias(item)))
+        head = item[0].upper
+        if head not in _AGGREGATES or len(item) < 3 or item[1].value != "(":
+            if not group_tokens or any(token.upper in _AGGREGATES for token in item):
+                return None, "only COUNT, SUM and AVG over plain columns can be approximated"
+            select_items.append(("group", token_text(sql_query, item)))
+            continue
+
+        depth, close = 0, None
+        for index, token in enumerate(item[1:], 1):
+            depth += token.value == "("
+            depth -= token.value == ")"
+            if depth == 0:
+                close = index
+                break
+        rest = item[close + 1:]
+        if rest and rest[0].upper == "AS":
+            rest = rest[1:]
+        if len(rest) > 1 or (rest and rest[0].kind not in ("word", "qident")):
+            return None, "aggregate expressions cannot be approximated"
+
+        argument_tokens = item[2:close]
+        if not argument_tokens:
+            return None, "empty aggregate"
+        argument = None if head == "COUNT" and [t.value for t in argument_tokens] == ["*"] else token_text(sql_query, argument_tokens)
+        if head != "COUNT" and argument is None:
+            return None, f"{head}(*) is not valid"
+        name = rest[0].name if rest else head.lower()
+        select_items.append(("aggregate", Aggregate(head, argument, name)))
+
+    if not any(kind == "aggregate" for kind, _ in select_items):
+        return None, "query has no COUNT, SUM or AVG to estimate"
+
+    # The sample query adds columns, so GROUP BY 2 must become the expression it pointed at
+    group_parts = []
+    for group_item in split_top_level(group_tokens):
+        if len(group_item) == 1 and group_item[0].kind == "number":
+            position = int(group_item[0].value) - 1 if group_item[0].value.isdigit() else -1
+            if not 0 <= position < len(select_items) or select_items[position][0] != "group":
+                return None, "GROUP BY position does not name a grouping column"
+            group_parts.append(expressions[position])
+        else:
+            group_parts.append(token_text(sql_query, group_item))
+
+    where_tokens = tokens[slice(*bounds["WHERE"])] if "WHERE" in bounds else []
+    return ApproximatePlan(
+        table=next(iter(parsed.tables)),
+        select_items=tuple(select_items),
+        from_clause=token_text(sql_query, from_tokens),
+        where_clause=token_text(sql_query, where_tokens),
+        group_clause=", ".join(group_parts) if group_tokens else "",
+    ), None
+
+
+def sample_sql(plan: ApproximatePlan, sample_percent: float) -> str:
+    """The plan as a TABLESAMPLE query that also returns what the error bounds need"""
+    columns = []
+    for index, (kind, item) in enumerate(plan.select_items):
+        if kind == "group":
+            columns.append(item)
+        elif item.function == "COUNT":
+            columns.append(f"COUNT({item.argument or '*'}) AS qc_{index}")
+        elif item.function == "SUM":
+            columns.append(f"SUM({item.argument}) AS qc_{index}")
+            columns.append(f"SUM(({item.argument}) * ({item.argument})) AS qc_{index}_sq")
+        else:
+            columns.append(f"AVG({item.argument}) AS qc_{index}")
+            columns.append(f"STDDEV_SAMP({item.argument}) AS qc_{index}_sd")
+            columns.append(f"COUNT({item.argument}) AS qc_{index}_n")
+
+    columns.append("COUNT(*) AS qc_rows")
+    sql_query = f"SELECT {', '.join(columns)} FROM {plan.from_clause} TABLESAMPLE {plan.sample_method} ({sample_percent:.4f})"
+    if plan.where_clause:
+        sql_query += f" WHERE {plan.where_clause}"
+    if plan.group_clause:
+        sql_query += f" GROUP BY {plan.group_clause}"
+    return sql_query
+
+
+def _number(value) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def _estimate(row: Dict, index: int, aggregate: Aggregate, fraction: float) -> Tuple:
+    """(estimate, 95% error bound) for one aggregate of a sampled row
+
+    Bounds treat the sample as independent rows, which only BERNOULLI samples are.
+    """
+    value = row.get(f"qc_{index}")
+    if aggregate.function == "COUNT":
+        count = _number(value)
+        return int(round(count / fraction)), int(round(_Z * math.sqrt(count * (1 - fraction)) / fraction))
+    if aggregate.function == "SUM":
+        if value is None:
+            return None, None
+        squares = _number(row.get(f"qc_{index}_sq"))
+        return round(_number(value) / fraction, 2), round(_Z * math.sqrt((1 - fraction) * squares) / fraction, 2)
+
+    count = _number(row.get(f"qc_{index}_n"))
+    if value is None:
+        return None, None
+    bound = _Z * _number(row.get(f"qc_{index}_sd")) / math.sqrt(count) if count > 1 else None
+    return round(_number(value), 2), round(bound, 2) if bound is not None else None
+
+
+def table_statistics(cursor, table: str) -> Tuple[Optional[float], int]:
+    """Planner row estimate of table and rows modified since it was last analyzed"""
+    cursor.execute(
+        "SELECT c.reltuples, COALESCE(s.n_mod_since_analyze, 0) FROM pg_class c "
+        "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid WHERE c.oid = to_regclass(%s)",
+        [table]
+    )
+    row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] <= 0:
+        # -1 (or 0 before PostgreSQL 14) means never analyzed
+        return None, 0
+    return float(row[0]), int(row[1])
+
+
+def run_approximation(cursor, vendor: str, sql_query: str, min_rows: int,
+                      sample_rows: int) -> Tuple[Optional[List[Dict]], Dict]:
+    """Estimated rows plus a description of how they were estimated
+
+    Returns (None, {"method": "exact", "reason": ...}) when the query should
+    simply run as written: not PostgreSQL, not an eligible aggregate, a table
+    small enough to scan, or a sample that found nothing.
+    """
+    if vendor != "postgresql":
+        return None, {"method": "exact", "reason": "approximate answers need PostgreSQL TABLESAMPLE"}
+
+    plan, reason = plan_approximation(sql_query)
+    if plan is None:
+        return None, {"method": "exact", "reason": reason}
+
+    table_rows, modified = table_statistics(cursor, plan.table)
+    if table_rows is None:
+        return None, {"method": "exact", "reason": f"{plan.table} has no planner statistics yet"}
+    if table_rows < min_rows:
+        return None, {"method": "exact", "reason": f"{plan.table} has about {int(table_rows)} rows, small enough to scan"}
+
+    if plan.is_table_count:
+        name = plan.aggregates[0].name
+        return [{name: int(table_rows)}], {
+            "method": "statistics",
+            "table": plan.table,
+            "confidence": None,
+            # reltuples was exact as of the last ANALYZE; every change since can move the count by one
+            "error_bounds": [{name: modified}],
+        }
+
+    sample_percent = min(100.0, max(0.01, 100.0 * sample_rows / table_rows))
+    if sample_percent >= 100.0:
+        return None, {"method": "exact", "reason": "the sample would cover the whole table"}
+
+    cursor.execute(sample_sql(plan, sample_percent))
+    columns = [column[0] for column in cursor.description]
+    sampled = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    # Rare rows may be the whole answer; a sample that missed them says nothing
+    if not sum(_number(row["qc_rows"]) for row in sampled):
+        return None, {"method": "exact", "reason": "the sample matched no rows"}
+
+    fraction = sample_percent / 100.0
+    group_columns = [column for column in columns if not column.startswith("qc_")]
+    results, error_bounds = [], []
+    for row in sampled:
+        result, bounds = {}, {}
+        group_names = iter(group_columns)
+        for index, (kind, item) in enumerate(plan.select_items):
+            if kind == "group":
+                name = next(group_names)
+                result[name] = row[name]
+                continue
+            result[item.name], bounds[item.name] = _estimate(row, index, item, fraction)
+        results.append(result)
+        error_bounds.append(bounds)
+
+    logger.info(f"Approximated {plan.table} from a {sample_percent:.2f}% {plan.sample_method} sample "
+                f"of about {int(table_rows)} rows")
+    return results, {
+        "method": "sample",
+        "table": plan.table,
+        "sample_method": plan.sample_method,
+        "sample_percent": round(sample_percent, 4),
+        "estimated_table_rows": int(table_rows),
+        # Page samples of clustered rows vary more than the row-level bounds account for
+        "confidence": CONFIDENCE if plan.sample_method == "BERNOULLI" else None,
+        "error_bounds": error_bounds,
+    }
@@ -0,0 +1,147 @@
+import os
+import random
+import logging
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, router
+
+logger = logging.getLogger(__name__)
+
+# Default byte budget when OPTIONS has no MAX_BYTES
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Byte accounting per LocMemCache name, shared like Django's own per-name dicts
+_locmem_sizes = {}
+
+
+def _max_bytes(params) -> int:
+    return int(params.get("OPTIONS", {}).get("MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+class SizeAwareLocMemCache(LocMemCache):
+    """LocMemCache that also evicts least recently used entries to stay under MAX_BYTES"""
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.max_bytes = _max_bytes(params)
+        self._sizes = _locmem_sizes.setdefault(name, {"total": 0, "keys": {}})
+
+    def _set(self, key, value, timeout=None):
+        super()._set(key, value, timeout)
+        sizes = self._sizes
+        sizes["total"] += len(value) - sizes["keys"].get(key, 0)
+        sizes["keys"][key] = len(value)
+
+        # Recently used entries sit at the front, so popitem() takes the least recently used one
+        while sizes["total"] > self.max_bytes and len(self._cache) > 1:
+            self._evict_lru()
+
+    def _evict_lru(self):
+        key, _ = self._cache.popitem()
+        self._expire_info.pop(key, None)
+        self._sizes["total"] -= self._sizes["keys"].pop(key, 0)
+
+    def _cull(self):
+        if self._cull_frequency == 0:
+            self._clear_locked()
+            return
+        for _ in range(len(self._cache) // self._cull_frequency):
+            self._evict_lru()
+
+    def _delete(self, key):
+        deleted = super()._delete(key)
+        if deleted:
+            self._sizes["total"] -= self._sizes["keys"].pop(key, 0)
+        return deleted
+
+    def _clear_locked(self):
+        self._cache.clear()
+        self._expire_info.clear()
+        self._sizes["total"] = 0
+        self._sizes["keys"].clear()
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+
+class SizeAwareFileBasedCache(FileBasedCache):
+    """FileBasedCache shared by every worker on the host, trimmed oldest-first to MAX_BYTES on disk"""
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.max_bytes = _max_bytes(params)
+
+    def _cull(self):
+        super()._cull()
+
+        files = []
+        total = 0
+        for fname in self._list_cache_files():
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                # Another worker removed it in the meantime
+                continue
+            files.append((stat.st_mtime, stat.st_size, fname))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for _, size, fname in sorted(files):
+            self._delete(fname)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class SizeAwareDatabaseCache(DatabaseCache):
+    """DatabaseCache that keeps the table under MAX_BYTES, dropping the entries closest to expiry first
+
+    Summing value sizes scans the table, so the byte budget is checked on one
+    write in SIZE_CHECK_EVERY on average rather than on each one. The choice is
+    random: Django builds a cache instance per thread, and a request makes too
+    few writes for a per-instance counter to ever reach the check.
+    """
+
+    def __init__(self, table, params):
+        super().__init__(table, params)
+        options = params.get("OPTIONS", {})
+        self.max_bytes = _max_bytes(params)
+        self.size_check_every = max(1, int(options.get("SIZE_CHECK_EVERY", 20)))
+
+    def _base_set(self, mode, key, value, timeout=None):
+        result = super()._base_set(mode, key, value, timeout)
+        if random.random() * self.size_check_every < 1:
+            self.trim_to_size()
+        return result
+
+    def trim_to_size(self) -> int:
+        """Delete entries until the stored values fit the byte budget; returns how many were removed"""
+        db = router.db_for_write(self.cache_model_class)
+        connection = connections[db]
+        table = connection.ops.quote_name(self._table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT cache_key, LENGTH(value) FROM {table} ORDER BY expires")
+            rows = cursor.fetchall()
+            total = sum(size for _, size in rows)
+            if total <= self.max_bytes:
+                return 0
+
+            doomed = []
+            for cache_key, size in rows:
+                doomed.append(cache_key)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+            for start in range(0, len(doomed), 500):
+                chunk = doomed[start:start + 500]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM {table} WHERE cache_key IN ({placeholders})", chunk)
+
+        logger.info(f"Trimmed {len(doomed)} entries from cache table {self._table}")
+        return len(doomed)
@@ -0,0 +1,256 @@
+import re
+import logging
+from collections import deque
+from typing import Dict, List, Tuple, NamedTuple, Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # the linear model is optional; the matcher works without it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+COMPLEXITY_LEVELS = ("simple", "medium", "complex")
+
+# Token budgets handed to Ollama for each tier
+TOKEN_BUDGETS = {
+    "simple": {"num_ctx": 2048, "num_predict": 256},
+    "medium": {"num_ctx": 3072, "num_predict": 384},
+    "complex": {"num_ctx": 4096, "num_predict": 512},
+}
+
+# Phrases grouped by the SQL feature they usually imply, in English and Persian.
+# Persian entries longer than two letters match as word prefixes so suffixes (ها, ان, ی) still hit.
+VOCABULARY: Dict[str, Tuple[float, List[str]]] = {
+    "aggregation": (1.0, [
+        "sum", "total", "average", "avg", "mean", "count", "how many", "number of", "aggregate", "maximum",
+        "minimum", "revenue",
+        "مجموع", "جمع", "میانگین", "متوسط", "تعداد", "چند", "چه تعداد", "کل", "درآمد", "حداکثر",
+    ]),
+    "grouping": (1.0, [
+        "group by", "per", "for each", "each", "by category", "by status", "by month", "breakdown",
+        "به تفکیک", "بر اساس", "برای هر", "هر", "گروه",
+    ]),
+    "join": (1.0, [
+        "join", "along with", "together with", "their orders", "who ordered", "who bought", "customers who",
+        "products that", "ordered by", "bought by",
+        "به همراه", "همراه با", "سفارش داده", "خریده", "مشتریانی که", "محصولاتی که",
+    ]),
+    "ranking": (0.5, [
+        "rank", "top", "highest", "lowest", "most", "least", "best", "worst", "partition", "window",
+        "بیشترین", "کمترین", "رتبه", "برترین", "بالاترین", "پایین‌ترین", "پرفروش",
+    ]),
+    "nested": (1.5, [
+        "subquery", "nested", "more than average", "above average", "below average", "than the average",
+        "never", "have not", "haven't", "without any", "having", "at least", "more than",
+        "بیشتر از میانگین", "کمتر از میانگین", "هرگز", "هیچ", "حداقل", "بیش از",
+    ]),
+    "time": (0.5, [
+        "last month", "last year", "last week", "this month", "this year", "monthly", "weekly", "daily",
+        "trend", "over time", "between",
+        "ماه گذشته", "سال گذشته", "هفته گذشته", "ماهانه", "روزانه", "روند", "بین",
+    ]),
+    "comparison": (1.5, [
+        "compare", "compared", "comparison", "versus", "vs", "difference", "ratio", "percentage", "growth",
+        "مقایسه", "تفاوت", "نسبت", "درصد", "رشد",
+    ]),
+}
+
+FEATURE_GROUPS = tuple(VOCABULARY)
+
+_PERSIAN_RE = re.compile(r"[؀-ۿ]")
+_NORMALIZE_RE = re.compile(r"[^\w؀-ۿ]+")
+_ARABIC_TO_PERSIAN = str.maketrans({"ي": "ی", "ك": "ک", "\u200c": " "})
+
+
+class ComplexityPrediction(NamedTuple):
+    complexity: str
+    score: float
+    features: Dict[str, int]
+    token_budget: Dict[str, int]
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every vocabulary hit"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+
+        for pattern, label in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(label)
+
+        # Breadth-first failure links; outputs are merged so matching never walks the fail chain
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_labels(self, text: str) -> List[str]:
+        labels = []
+        state = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                labels.extend(output[state])
+        return labels
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, unify Persian letters, and pad words with spaces for boundary matching"""
+    text = question.lower().translate(_ARABIC_TO_PERSIAN)
+    return f" {_NORMALIZE_RE.sub(' ', text).strip()} "
+
+
+def _pattern_key(phrase: str) -> str:
+    phrase = normalize_question(phrase).strip()
+    # English phrases must match whole words; longer Persian ones may carry suffixes
+    if _PERSIAN_RE.search(phrase) and len(phrase) > 2:
+        return f" {phrase}"
+    return f" {phrase} "
+
+
+class ComplexityClassifier:
+    """Predicts query complexity and the matching token budget from the question text"""
+
+    def __init__(self, vocabulary: Optional[Dict[str, Tuple[float, List[str]]]] = None):
+        self.vocabulary = vocabulary or VOCABULARY
+        self.weights = {group: weight for group, (weight, _) in self.vocabulary.items()}
+        self.matcher = AhoCorasick(
+            (_pattern_key(phrase), group)
+            for group, (_, phrases) in self.vocabulary.items()
+            for phrase in phrases
+        )
+        self.model: Optional["LinearComplexityModel"] = None
+
+    def features(self, question: str) -> Dict[str, int]:
+        counts = dict.fromkeys(self.vocabulary, 0)
+        for group in self.matcher.find_labels(normalize_question(question)):
+            counts[group] += 1
+        return counts
+
+    def heuristic_score(self, features: Dict[str, int]) -> float:
+        # Distinct feature groups matter more than repeated words from one group
+        return sum(self.weights[group] * min(count, 2) for group, count in features.items())
+
+    def classify(self, question: str) -> ComplexityPrediction:
+        return self.classify_many([question])[0]
+
+    def classify_many(self, questions: List[str]) -> List[ComplexityPrediction]:
+        """Classify a batch; the linear model, when trained, scores all questions in one matrix product"""
+        feature_rows = [self.features(question) for question in questions]
+        scores = [self.heuristic_score(features) for features in feature_rows]
+
+        if self.model is not None:
+            levels = self.model.predict_many(questions, feature_rows)
+        else:
+            levels = [self._level_from_score(score) for score in scores]
+
+        return [
+            ComplexityPrediction(level, score, features, dict(TOKEN_BUDGETS[level]))
+            for level, score, features in zip(levels, scores, feature_rows)
+        ]
+
+    def _level_from_score(self, score: float) -> str:
+        if score >= 3:
+            return "complex"
+        if score >= 1:
+            return "medium"
+        return "simple"
+
+    def train_from_history(self, history: List[Dict], min_examples: int = 30) -> bool:
+        """Fit the optional linear model on successful history entries labelled by their SQL"""
+        if np is None:
+            return False
+
+        examples = [
+            (entry["question"], complexity_from_sql(entry["sql_query"]))
+            for entry in history
+            if entry.get("sql_query") and not entry.get("error")
+        ]
+        if len(examples) < min_examples or len({label for _, label in examples}) < 2:
+            return False
+
+        model = LinearComplexityModel(self)
+        model.fit([question for question, _ in examples], [label for _, label in examples])
+        self.model = model
+        logger.info(f"Trained complexity model on {len(examples)} history entries")
+        return True
+
+
+class LinearComplexityModel:
+    """Softmax regression over matcher features, trained with plain NumPy gradient descent"""
+
+    def __init__(self, classifier: ComplexityClassifier, epochs: int = 300, learning_rate: float = 0.5):
+        if np is None:
+            raise ImportError("LinearComplexityModel requires numpy")
+        self.classifier = classifier
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.weights = None
+
+    def _matrix(self, questions: List[str], feature_rows: List[Dict[str, int]]):
+        matrix = np.empty((len(questions), len(FEATURE_GROUPS) + 3))
+        for row, (question, features) in enumerate(zip(questions, feature_rows)):
+            matrix[row, :len(FEATURE_GROUPS)] = [min(features.get(group, 0), 3) for group in FEATURE_GROUPS]
+            matrix[row, -3] = min(len(question.split()) / 20.0, 3.0)
+            matrix[row, -2] = 1.0 if _PERSIAN_RE.search(question) else 0.0
+            matrix[row, -1] = 1.0
+        return matrix
+
+    def fit(self, questions: List[str], labels: List[str]):
+        features = self._matrix(questions, [self.classifier.features(question) for question in questions])
+        targets = np.zeros((len(labels), len(COMPLEXITY_LEVELS)))
+        targets[np.arange(len(labels)), [COMPLEXITY_LEVELS.index(label) for label in labels]] = 1.0
+
+        self.weights = np.zeros((features.shape[1], len(COMPLEXITY_LEVELS)))
+        for _ in range(self.epochs):
+            probabilities = self._softmax(features @ self.weights)
+            gradient = features.T @ (probabilities - targets) / len(labels)
+            self.weights -= self.learning_rate * gradient
+        return self
+
+    def predict_many(self, questions: List[str], feature_rows: List[Dict[str, int]]) -> List[str]:
+        scores = self._matrix(questions, feature_rows) @ self.weights
+        return [COMPLEXITY_LEVELS[index] for index in scores.argmax(axis=1)]
+
+    @staticmethod
+    def _softmax(logits):
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+_SQL_FEATURE_RES = {
+    "join": re.compile(r"\bJOIN\b", re.IGNORECASE),
+    "aggregation": re.compile(r"\b(?:COUNT|SUM|AVG|MIN|MAX)\s*\(|\bGROUP\s+BY\b", re.IGNORECASE),
+    "subquery": re.compile(r"\(\s*SELECT\b|\bWITH\b", re.IGNORECASE),
+    "window": re.compile(r"\bOVER\s*\(", re.IGNORECASE),
+}
+
+
+def complexity_from_sql(sql_query: str) -> str:
+    """Label a successful query by the SQL features it actually needed"""
+    hits = sum(1 for pattern in _SQL_FEATURE_RES.values() if pattern.search(sql_query))
+    if hits >= 2:
+        return "complex"
+    if hits == 1:
+        return "medium"
+    return "simple"
@@ -0,0 +1,146 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+
+from .answer_cache import pack_rows, unpack_rows
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_ID_RE = re.compile(r"^[\w-]{1,64}$")
+
+# Openers that only make sense relative to the previous answer ("now only for Books", "حالا فقط ...")
+_FOLLOW_UP_RE = re.compile(
+    r"^(?:now|then|and|also|but|instead|only|just|same|what about|how about|sort|order|filter|show only|"
+    r"limit|exclude|without|group|break (?:it|that) down|حالا|فقط|و |همین|مرتب)\b",
+    re.IGNORECASE
+)
+
+_SORT_RE = re.compile(
+    r"^(?:now\s+|then\s+)?(?:sort|order)(?:ed)?\s+(?:it\s+|them\s+|that\s+|the results?\s+)?by\s+(?:the\s+)?"
+    r"(?P<column>[\w ]+?)(?:\s+(?P<direction>asc|ascending|desc|descending|(?:highest|largest|most|lowest|smallest|least) first))?"
+    r"\s*[.?!]*$",
+    re.IGNORECASE
+)
+_FILTER_RE = re.compile(
+    r"^(?:now\s+|then\s+)?(?:show\s+)?(?:only|just)\s+(?:where\s+(?P<column>[\w ]+?)\s+(?:is|=)\s+)?"
+    r"(?:for\s+|in\s+|with\s+|the\s+)?(?P<value>.+?)\s*[.?!]*$",
+    re.IGNORECASE
+)
+_DESCENDING = ("desc", "descending", "highest first", "largest first", "most first")
+
+
+def is_follow_up(question: str) -> bool:
+    """Whether question reads as a refinement of the previous answer rather than a new question"""
+    return bool(_FOLLOW_UP_RE.match(question.strip()))
+
+
+def _find_column(name: str, columns: List[str]) -> Optional[str]:
+    wanted = re.sub(r"\s+", "_", name.strip().lower())
+    exact = [column for column in columns if column.lower() == wanted]
+    if exact:
+        return exact[0]
+    partial = [column for column in columns if wanted in column.lower()]
+    return partial[0] if len(partial) == 1 else None
+
+
+def parse_refinement(question: str, rows: List[Dict]) -> Optional[Dict]:
+    """A sort or equality filter over the previous rows, when question asks for nothing more
+
+    Returns {"kind": "sort", "column", "descending"} or {"kind": "filter",
+    "column", "value"}; anything that needs new columns or rows returns None.
+    """
+    if not rows:
+        return None
+    columns = list(rows[0])
+    question = question.strip()
+
+    match = _SORT_RE.match(question)
+    if match:
+        column = _find_column(match.group("column"), columns)
+        if column is None:
+            return None
+        direction = (match.group("direction") or "").lower()
+        return {"kind": "sort", "column": column, "descending": direction in _DESCENDING}
+
+    match = _FILTER_RE.match(question)
+    if match:
+        value = match.group("value").strip().strip("'\"").casefold()
+        candidates = [_find_column(match.group("column"), columns)] if match.group("column") else columns
+        # The value must be one the previous result actually shows, in exactly one column
+        matching = [
+            column for column in candidates
+            if column is not None and any(isinstance(row.get(column), str) and row[column].casefold() == value
+                                          for row in rows)
+        ]
+        if len(matching) != 1:
+            return None
+        column = matching[0]
+        original = next(row[column] for row in rows
+                        if isinstance(row.get(column), str) and row[column].casefold() == value)
+        return {"kind": "filter", "column": column, "value": original}
+
+    return None
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def apply_refinement(refinement: Dict, previous_sql: str, rows: List[Dict]) -> Tuple[str, List[Dict]]:
+    """(SQL equivalent of the refinement, refined rows) without touching the database"""
+    inner = previous_sql.strip().rstrip(";").strip()
+    column = refinement["column"]
+
+    if refinement["kind"] == "sort":
+        direction = "DESC" if refinement["descending"] else "ASC"
+        sql_query = f"SELECT * FROM ({inner}) AS previous ORDER BY {_quote(column)} {direction} NULLS LAST"
+        present = [row for row in rows if row.get(column) is not None]
+        missing = [row for row in rows if row.get(column) is None]
+        return sql_query, sorted(present, key=lambda row: row[column], reverse=refinement["descending"]) + missing
+
+    value = refinement["value"].replace("'", "''")
+    sql_query = f"SELECT * FROM ({inner}) AS previous WHERE {_quote(column)} = '{value}'"
+    return sql_query, [row for row in rows if row.get(column) == refinement["value"]]
+
+
+class ConversationStore:
+    """Last answered turn of each conversation, in the shared querycraft cache so any worker can continue it"""
+
+    def __init__(self, alias: Optional[str] = None):
+        self.alias = alias or settings.QUERYCRAFT_CACHE_ALIAS
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        try:
+            turn = self.cache.get(f"qc:conversation:{conversation_id}")
+        except Exception as e:
+            logger.warning(f"Conversation read failed: {str(e)}")
+            return None
+        if turn is None:
+            return None
+        turn = dict(turn)
+        try:
+            turn["rows"] = unpack_rows(turn["rows"]) if turn.get("rows") is not None else None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable conversation rows: {str(e)}")
+            turn["rows"] = None
+        return turn
+
+    def save(self, conversation_id: str, question: str, sql_query: str, target: str,
+             rows: Optional[List[Dict]] = None):
+        """Remember this turn; rows are kept only when small enough to refine locally"""
+        payload = None
+        if rows is not None and len(rows) <= settings.QUERYCRAFT_CONVERSATION_MAX_ROWS:
+            payload = pack_rows(rows)
+            if len(payload) > settings.QUERYCRAFT_CACHE_MAX_ITEM_BYTES:
+                payload = None
+        turn = {"question": question, "sql": sql_query, "target": target, "rows": payload}
+        try:
+            self.cache.set(f"qc:conversation:{conversation_id}", turn, settings.QUERYCRAFT_CONVERSATION_TTL)
+        except Exception as e:
+            logger.warning(f"Conversation write failed: {str(e)}")
@@ -0,0 +1,209 @@
+import re
+import time
+import random
+import logging
+import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+from django.db import connection
+
+from .pagination import parse_order_by
+
+logger = logging.getLogger(__name__)
+
+# Questions over the seed_db schema with the SQL that answers them; tier is the complexity a correct answer needs
+EVAL_CORPUS = [
+    {"question": "Show me all customers", "lang": "en", "tier": "simple",
+     "sql": "SELECT id, name, email, registration_date FROM core_customer"},
+    {"question": "What is the most expensive product?", "lang": "en", "tier": "simple",
+     "sql": "SELECT name, price FROM core_product ORDER BY price DESC LIMIT 1"},
+    {"question": "List products in the Books category", "lang": "en", "tier": "simple",
+     "sql": "SELECT id, name, category, price FROM core_product WHERE category = 'Books'"},
+    {"question": "Which orders are cancelled?", "lang": "en", "tier": "simple",
+     "sql": "SELECT id, customer_id, product_id, order_date, quantity, status FROM core_order WHERE status = 'cancelled'"},
+    {"question": "Show the 5 cheapest products", "lang": "en", "tier": "simple",
+     "sql": "SELECT name, price FROM core_product ORDER BY price ASC LIMIT 5"},
+    {"question": "How many customers are there?", "lang": "en", "tier": "medium",
+     "sql": "SELECT COUNT(*) FROM core_customer"},
+    {"question": "What is the average product price?", "lang": "en", "tier": "medium",
+     "sql": "SELECT AVG(price) FROM core_product"},
+    {"question": "Count orders by status", "lang": "en", "tier": "medium",
+     "sql": "SELECT status, COUNT(*) FROM core_order GROUP BY status"},
+    {"question": "How many products are in each category?", "lang": "en", "tier": "medium",
+     "sql": "SELECT category, COUNT(*) FROM core_product GROUP BY category"},
+    {"question": "How many customers registered in the last 30 days?", "lang": "en", "tier": "medium",
+     "sql": "SELECT COUNT(*) FROM core_customer WHERE registration_date >= CURRENT_DATE - INTERVAL '30 days'"},
+    {"question": "Top 5 customers by total spend", "lang": "en", "tier": "complex",
+     "sql": "SELECT c.name, SUM(o.quantity * p.price) AS total_spend FROM core_order o "
+            "JOIN core_customer c ON c.id = o.customer_id JOIN core_product p ON p.id = o.product_id "
+            "GROUP BY c.id, c.name ORDER BY total_spend DESC LIMIT 5"},
+    {"question": "Total revenue per category", "lang": "en", "tier": "complex",
+     "sql": "SELECT p.category, SUM(o.quantity * p.price) AS revenue FROM core_order o "
+            "JOIN core_product p ON p.id = o.product_id GROUP BY p.category"},
+    {"question": "Total quantity ordered per customer along with their names", "lang": "en", "tier": "complex",
+     "sql": "SELECT c.name, SUM(o.quantity) AS total_quantity FROM core_order o "
+            "JOIN core_customer c ON c.id = o.customer_id GROUP BY c.id, c.name"},
+    {"question": "Which customers have never placed an order?", "lang": "en", "tier": "complex",
+     "sql": "SELECT c.name FROM core_customer c WHERE NOT EXISTS "
+            "(SELECT 1 FROM core_order o WHERE o.customer_id = c.id)"},
+    {"question": "همه مشتریان را نشان بده", "lang": "fa", "tier": "simple",
+     "sql": "SELECT id, name, email, registration_date FROM core_customer"},
+    {"question": "گران‌ترین محصول کدام است؟", "lang": "fa", "tier": "simple",
+     "sql": "SELECT name, price FROM core_product ORDER BY price DESC LIMIT 1"},
+    {"question": "محصولات دسته‌بندی Electronics را نشان بده", "lang": "fa", "tier": "simple",
+     "sql": "SELECT id, name, category, price FROM core_product WHERE category = 'Electronics'"},
+    {"question": "تعداد سفارش‌های لغو شده چقدر است؟", "lang": "fa", "tier": "medium",
+     "sql": "SELECT COUNT(*) FROM core_order WHERE status = 'cancelled'"},
+    {"question": "میانگین قیمت محصولات چقدر است؟", "lang": "fa", "tier": "medium",
+     "sql": "SELECT AVG(price) FROM core_product"},
+    {"question": "تعداد محصولات در هر دسته‌بندی", "lang": "fa", "tier": "medium",
+     "sql": "SELECT category, COUNT(*) FROM core_product GROUP BY category"},
+    {"question": "مجموع فروش به تفکیک دسته‌بندی", "lang": "fa", "tier": "complex",
+     "sql": "SELECT p.category, SUM(o.quantity * p.price) AS revenue FROM core_order o "
+            "JOIN core_product p ON p.id = o.product_id GROUP BY p.category"},
+    {"question": "پنج مشتری برتر بر اساس مجموع خرید", "lang": "fa", "tier": "complex",
+     "sql": "SELECT c.name, SUM(o.quantity * p.price) AS total_spend FROM core_order o "
+            "JOIN core_customer c ON c.id = o.customer_id JOIN core_product p ON p.id = o.product_id "
+            "GROUP BY c.id, c.name ORDER BY total_spend DESC LIMIT 5"},
+]
+
+_QUESTION_RE = re.compile(r'Natural Language Question: "(.*)"')
+
+
+class FakeLLM:
+    """Stands in for OllamaClient by answering each corpus question with its gold SQL
+
+    noise swaps that fraction of answers for another question's SQL, which shows
+    the comparison catching wrong answers; latency simulates generation time.
+    """
+
+    def __init__(self, corpus: List[Dict], noise: float = 0.0, latency: float = 0.0, seed: int = 0):
+        self.answers = {item["question"]: item["sql"] for item in corpus}
+        self.noise = noise
+        self.latency = latency
+        self.random = random.Random(seed)
+
+    def generate(self, prompt: str, options: Dict, on_token=None, cancel_event=None) -> Dict:
+        match = _QUESTION_RE.search(prompt)
+        question = match.group(1) if match else ""
+        sql_query = self.answers.get(question, "SELECT 1")
+        if self.noise and self.random.random() < self.noise:
+            sql_query = self.random.choice(list(self.answers.values()))
+
+        if self.latency:
+            time.sleep(self.latency)
+        response = sql_query + ";"
+        if on_token is not None:
+            on_token(response)
+
+        return {
+            "response": response,
+            "done": True,
+            "done_reason": "stop",
+            "eval_count": max(len(response) // 4, 1),
+            "prompt_eval_count": len(prompt) // 4,
+        }
+
+
+def _normalize_value(value):
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 2)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _normalize_rows(rows: List, ordered: bool) -> List:
+    # Column order and names don't matter, only the values each row carries
+    normalized = [tuple(sorted((_normalize_value(value) for value in row), key=repr)) for row in rows]
+    return normalized if ordered else sorted(normalized, key=repr)
+
+
+def results_match(gold_sql: str, gold_rows: List, predicted_rows: List) -> bool:
+    """Execution accuracy: same rows as the gold query, in order only when the gold query orders them"""
+    # None means an ORDER BY on expressions, which still fixes the order
+    ordered = parse_order_by(gold_sql) != []
+    return _normalize_rows(gold_rows, ordered) == _normalize_rows(predicted_rows, ordered)
+
+
+def execute_gold(sql_query: str) -> List:
+    with connection.cursor() as cursor:
+        cursor.execute(sql_query)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def evaluate_item(agent, item: Dict, candidates: Optional[int] = None) -> Dict:
+    """Run one corpus question through the agent and score it against the gold SQL"""
+    record = {
+        "question": item["question"],
+        "lang": item["lang"],
+        "tier": item["tier"],
+        "predicted_tier": None,
+        "correct": False,
+        "error": None,
+        "sql": None,
+        "generation_time": 0.0,
+        "execution_time": 0.0,
+        "total_time": 0.0,
+        "tokens_used": 0,
+    }
+
+    try:
+        gold_rows = execute_gold(item["sql"])
+    except Exception as e:
+        record["error"] = f"Gold SQL failed: {str(e)}"
+        record["skipped"] = True
+        return record
+
+    start_time = time.time()
+    result = agent.process_question(item["question"], record_history=False, candidates=candidates)
+    record["total_time"] = time.time() - start_time
+
+    record["predicted_tier"] = result.get("query_complexity")
+    record["sql"] = result.get("sql_query")
+    record["tokens_used"] = result.get("tokens_used") or 0
+    record["generation_time"] = result.get("generation_time") or 0.0
+
+    if result.get("error"):
+        record["error"] = result["error"]
+        return record
+
+    record["execution_time"] = result.get("execution_time") or 0.0
+    predicted_rows = [tuple(row.values()) for row in result.get("execution_result") or []]
+    record["correct"] = results_match(item["sql"], gold_rows, predicted_rows)
+    return record
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(records: List[Dict]) -> Dict[str, Dict]:
+    """Accuracy, latency and token use per tier, plus an 'all' row"""
+    scored = [record for record in records if not record.get("skipped")]
+    groups = {"all": scored}
+    for record in scored:
+        groups.setdefault(record["tier"], []).append(record)
+
+    summary = {}
+    for tier, group in groups.items():
+        if not group:
+            continue
+        generation = [record["generation_time"] for record in group]
+        execution = [record["execution_time"] for record in group]
+        total = [record["total_time"] for record in group]
+        summary[tier] = {
+            "questions": len(group),
+            "accuracy": sum(record["correct"] for record in group) / len(group),
+            "errors": sum(1 for record in group if record["error"]),
+            "tier_agreement": sum(record["predicted_tier"] == record["tier"] for record in group) / len(group),
+            "generation_p50": _percentile(generation, 0.5),
+            "generation_p95": _percentile(generation, 0.95),
+            "execution_p50": _percentile(execution, 0.5),
+            "total_p95": _percentile(total, 0.95),
+            "avg_tokens": sum(record["tokens_used"] for record in group) / len(group),
+        }
+    return summary
@@ -0,0 +1,127 @@
+import math
+import re
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Persian words keep their zero-width non-joiner, so "سفارش‌ها" stays one term
+_TERM_RE = re.compile(r"[\w\u200c]+")
+
+# Rough prompt cost of an example; the learned tokens-per-char ratio is per tier, not per snippet
+CHARS_PER_TOKEN = 4
+
+
+def question_terms(question: str) -> List[str]:
+    """Unigrams plus bigrams, so a shared phrase like 'per category' outweighs the same words scattered"""
+    words = _TERM_RE.findall(normalize_question(question))
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class ExampleStore:
+    """Validated question/SQL pairs with a TF-IDF inverted index for picking few-shot examples
+
+    The index is rebuilt lazily after additions; with a few thousand short
+    questions that costs milliseconds and keeps lookups to the candidate
+    documents that share a term with the question.
+    """
+
+    def __init__(self, max_examples: int = 1000):
+        self.max_examples = max_examples
+        self.examples: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.loaded = False
+        self._index = None
+
+    def add(self, question: str, sql_query: str, target: str = "default"):
+        key = (target, normalize_question(question))
+        with self.lock:
+            # The latest working SQL for a question replaces older ones
+            self.examples.pop(key, None)
+            self.examples[key] = {"question": question, "sql": sql_query.strip(), "target": target}
+            while len(self.examples) > self.max_examples:
+                self.examples.popitem(last=False)
+            self._index = None
+
+    def load_from_history(self, limit: Optional[int] = None):
+        """Seed the store from persisted history: newest successful answers first"""
+        from .models import QueryLog
+
+        limit = limit or self.max_examples
+        # One attempt per process; later answers arrive through add() anyway
+        self.loaded = True
+        try:
+            rows = list(
+                QueryLog.objects.filter(error__isnull=True, follow_up=False).exclude(sql_query="")
+                .order_by("-created_at").values_list("question", "sql_query", "target")[:limit]
+            )
+        except Exception as e:
+            logger.warning(f"Could not load few-shot examples from history: {str(e)}")
+            return
+
+        # Oldest first, so the newest SQL for a repeated question wins
+        for question, sql_query, target in reversed(rows):
+            self.add(question, sql_query, target)
+        logger.info(f"Loaded {len(rows)} few-shot examples from history")
+
+    def _build_index(self):
+        documents = list(self.examples.values())
+        term_counts = [Counter(question_terms(document["question"])) for document in documents]
+
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+        total = len(documents)
+        idf = {term: math.log((1 + total) / (1 + frequency)) + 1 for term, frequency in document_frequency.items()}
+
+        postings = defaultdict(list)
+        for doc_id, counts in enumerate(term_counts):
+            weights = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                postings[term].append((doc_id, weight / norm))
+
+        return documents, idf, postings
+
+    def similar(self, question: str, target: str = "default", k: int = 3, token_budget: int = 300,
+                min_score: float = 0.1) -> List[Dict]:
+        """Up to k examples most similar to question whose combined size fits token_budget"""
+        with self.lock:
+            if not self.examples:
+                return []
+            if self._index is None:
+                self._index = self._build_index()
+            documents, idf, postings = self._index
+
+        counts = Counter(question_terms(question))
+        weights = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items() if term in idf}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if not norm:
+            return []
+
+        scores = defaultdict(float)
+        for term, weight in weights.items():
+            for doc_id, doc_weight in postings[term]:
+                scores[doc_id] += weight / norm * doc_weight
+
+        normalized = normalize_question(question)
+        selected = []
+        spent = 0
+        for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if score < min_score or len(selected) >= k:
+                break
+            document = documents[doc_id]
+            # An identical question is the answer cache's job; a shot should teach something new
+            if document["target"] != target or normalize_question(document["question"]) == normalized:
+                continue
+            cost = (len(document["question"]) + len(document["sql"])) // CHARS_PER_TOKEN + 1
+            if spent + cost > token_budget:
+                continue
+            spent += cost
+            selected.append(dict(document, score=round(score, 3)))
+
+        return selected
@@ -0,0 +1,112 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class QueryJobManager:
+    """Runs questions on a bounded worker pool and keeps results for a limited time"""
+
+    def __init__(self, runner: Callable[..., Dict], max_workers: int = 2, max_pending: int = 50, ttl: int = 900):
+        self.runner = runner
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="querycraft-job")
+        self.jobs: Dict[str, Dict] = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, question: str, **kwargs) -> Dict:
+        """Queue a question and return its job record"""
+        self.purge_expired()
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "question": question,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+        }
+
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs ({self.pending}), try again later")
+            self.pending += 1
+            self.jobs[job["job_id"]] = job
+
+            snapshot = dict(job)
+
+        self.executor.submit(self._run, job, kwargs)
+        return self.describe(snapshot)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        self.purge_expired()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            snapshot = dict(job) if job else None
+        return self.describe(snapshot) if snapshot else None
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def _run(self, job: Dict, kwargs: Dict):
+        with self.lock:
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+        try:
+            result = self.runner(job["question"], **kwargs)
+            status = "failed" if result.get("error") else "completed"
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} failed: {str(e)}")
+            result = {"error": str(e)}
+            status = "failed"
+        finally:
+            # Worker threads own their DB connections; don't leave them open between jobs
+            connections.close_all()
+
+        # Pollers must never see a finished status without its result and timings
+        with self.lock:
+            job["status"] = status
+            job["result"] = result
+            job["finished_at"] = time.time()
+            self.pending -= 1
+
+    def describe(self, job: Dict) -> Dict:
+        """Public view of a job, with a timing breakdown once it has started"""
+        now = time.time()
+        started_at = job["started_at"]
+        finished_at = job["finished_at"]
+        result = job["result"] or {}
+
+        timings = {
+            "queue_wait": round((started_at or now) - job["created_at"], 3),
+            "run_time": round((finished_at or now) - started_at, 3) if started_at else 0,
+        }
+        if finished_at:
+            timings["generation_time"] = round(result.get("generation_time") or 0, 3)
+            timings["sql_execution_time"] = round(result.get("execution_time") or 0, 3) if not result.get("error") else 0
+            timings["total"] = round(finished_at - job["created_at"], 3)
+
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "question": job["question"],
+            "timings": timings,
+            "result": result if finished_at else None,
+        }
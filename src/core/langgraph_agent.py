@@ -1,16 +1,42 @@
-import requests
-import re
 import logging
 import time
 import json
+import queue
+import threading
 from typing import TypedDict, Optional, Literal, List, Dict, Any
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from django.db import connection
+from django.conf import settings
+from django.core import signing
+from django.db import connections
 from datetime import datetime
+from .targets import get_target
+from .sql_validator import parse_sql, validate_sql, SQLValidationError
+from . import sql_extraction
+from .complexity import ComplexityClassifier, TOKEN_BUDGETS
+from .token_budget import AdaptiveTokenBudget
+from .llm import OllamaClient
+from .speculative import SpeculativeGenerator, explain_cost
+from .examples import ExampleStore
+from .pagination import (build_key, decode_cursor, encode_cursor, paginated_sql, parse_order_by, strip_terminator,
+                         unique_columns)
+from .answer_cache import AnswerCache, normalize_question
+from .sql_params import execute_parameterized, parameterize_sql
+from .approximate import run_approximation
+from .value_index import ValueIndex
+from .conversations import ConversationStore, apply_refinement, is_follow_up, parse_refinement
+from .models import QueryLog
 
 logger = logging.getLogger(__name__)
 
+# Shots for the application database until history has answered similar questions
+DEFAULT_EXAMPLES = [
+    {"question": "What is the most expensive product?",
+     "sql": "SELECT name, price FROM core_product ORDER BY price DESC LIMIT 1;"},
+    {"question": "How many customers registered last month?",
+     "sql": "SELECT COUNT(*) FROM core_customer WHERE registration_date >= CURRENT_DATE - INTERVAL '1 month';"},
+]
+
 class AgentState(TypedDict):
     question: str
     sql_query: Optional[str]
@@ -20,6 +46,22 @@ class AgentState(TypedDict):
     execution_time: Optional[float]
     tokens_used: Optional[int]
     query_complexity: Optional[Literal["simple", "medium", "complex"]]
+    referenced_tables: Optional[List[str]]
+    token_budget: Optional[Dict[str, int]]
+    generation_time: Optional[float]
+    page_size: Optional[int]
+    next_cursor: Optional[str]
+    cache_hit: Optional[bool]
+    result_cached_at: Optional[float]
+    record_history: Optional[bool]
+    target: Optional[str]
+    rows_truncated: Optional[bool]
+    candidates: Optional[int]
+    candidate_report: Optional[List[Dict]]
+    mode: Optional[Literal["exact", "approximate"]]
+    approximation: Optional[Dict]
+    conversation_id: Optional[str]
+    follow_up: Optional[Literal["edit", "local"]]
 
 class QueryHistory:
     """Simple in-memory query history storage"""
@@ -54,8 +96,19 @@ class QueryHistory:
 class QueryCraftLangGraphAgent:
     def __init__(self):
         self.ollama_url = "http://ollama:11434/api/generate"
+        self.llm = OllamaClient(self.ollama_url)
         self.workflow = self.build_workflow()
         self.query_history = QueryHistory()
+        self.complexity_classifier = ComplexityClassifier()
+        self.entries_since_training = 0
+        self.token_budget = AdaptiveTokenBudget()
+        self.answer_cache = AnswerCache()
+        self.example_store = ExampleStore(max_examples=settings.QUERYCRAFT_FEW_SHOT_MAX_EXAMPLES)
+        self.conversations = ConversationStore()
+        self.value_index = ValueIndex(enabled=settings.QUERYCRAFT_VALUE_INDEX)
+        self.speculative = SpeculativeGenerator(
+            self.llm, settings.QUERYCRAFT_CANDIDATE_TEMPERATURES, grace=settings.QUERYCRAFT_CANDIDATE_GRACE
+        )
         self.complex_queries = {
             "joins": ["JOIN", "INNER JOIN", "LEFT JOIN", "RIGHT JOIN", "FULL JOIN"],
             "aggregations": ["COUNT", "SUM", "AVG", "MIN", "MAX", "GROUP BY"],
@@ -100,30 +153,237 @@ class QueryCraftLangGraphAgent:
     
     def analyze_complexity_node(self, state: AgentState) -> AgentState:
         """Analyze the complexity of the natural language question"""
-        question = state.get("question", "").lower()
+        prediction = self.complexity_classifier.classify(state.get("question", ""))
         
-        complexity = "simple"
+        return {"query_complexity": prediction.complexity, "token_budget": prediction.token_budget}
+    
+    def generate_sql_node(self, state: AgentState, config: Optional[Dict] = None) -> AgentState:
+        """Generate SQL from natural language question"""
+        question = state.get("question", "")
+        emit = (config or {}).get("configurable", {}).get("emit")
+        complexity = state.get("query_complexity", "simple")
+        token_budget = state.get("token_budget") or TOKEN_BUDGETS[complexity]
+        target = get_target(state.get("target"))
+        
+        previous = self.previous_turn(state, target)
+        if previous is not None:
+            # Sorting or filtering rows we already have needs neither the model nor the database
+            refinement = parse_refinement(question, previous["rows"] or [])
+            if refinement:
+                sql_query, rows = apply_refinement(refinement, previous["sql"], previous["rows"])
+                logger.info(f"Refined the previous result locally: {refinement}")
+                return {
+                    "sql_query": sql_query,
+                    "execution_result": rows,
+                    "execution_time": 0,
+                    "generation_time": 0,
+                    "tokens_used": 0,
+                    "follow_up": "local"
+                }
         
-        # Check for indicators of complex queries
-        complex_indicators = [
-            "join", "aggregate", "sum", "average", "count", "group by",
-            "subquery", "nested", "window", "rank", "partition", "having"
-        ]
+        # A previously answered question skips the model entirely; the SQL is still validated downstream
+        # (follow-ups depend on the turn before them, so they are never served from the cache)
+        cached_sql = self.answer_cache.get_sql(question, target.name) if previous is None else None
+        if cached_sql:
+            logger.info(f"SQL cache hit for question: {question}")
+            return {
+                "sql_query": cached_sql,
+                "execution_time": 0,
+                "generation_time": 0,
+                "tokens_used": 0,
+                "cache_hit": True
+            }
         
-        complex_count = sum(1 for indicator in complex_indicators if indicator in question)
+        follow_up = "edit" if previous is not None else None
+        try:
+            # Exact stored spellings of the names and categories the question mentions
+            mentions = self.value_index.resolve(question) if target.is_default else []
+            if follow_up:
+                prompt = self.build_edit_prompt(question, previous, target, mentions)
+            else:
+                examples = self.find_examples(question, target.name)
+                prompt = self.build_prompt(question, complexity, target, examples, mentions)
+        except Exception as e:
+            logger.error(f"Error reading schema of target {target.name}: {str(e)}")
+            return {"error": f"Schema Error: {str(e)}"}
         
-        if complex_count >= 3:
-            complexity = "complex"
-        elif complex_count >= 1:
-            complexity = "medium"
+        # Smallest budget history says is safe for this tier; grown and retried if the output gets cut off
+        token_budget = self.token_budget.budget_for(complexity, len(prompt), default=token_budget)
+        
+        candidates = state.get("candidates") or settings.QUERYCRAFT_CANDIDATES
+        if candidates > 1:
+            result = self.generate_speculative(prompt, candidates, complexity, token_budget, question, target, emit)
+            result["follow_up"] = follow_up
+            return result
         
-        return {"query_complexity": complexity}
+        try:
+            start_time = time.time()
+            tokens_used = 0
+            
+            for attempt in range(settings.QUERYCRAFT_TRUNCATION_RETRIES + 1):
+                options = {
+                    "temperature": 0.1,
+                    "num_ctx": token_budget["num_ctx"],
+                    "num_predict": token_budget["num_predict"]
+                }
+                
+                # Stream tokens only when someone is listening for progress events
+                on_token = (lambda piece: emit("token", {"text": piece})) if emit else None
+                response_data = self.llm.generate(prompt, options, on_token=on_token)
+                
+                raw_response = response_data.get("response", "").strip()
+                tokens_used += response_data.get("eval_count", 0)
+                
+                truncated = self.token_budget.is_truncated(response_data, raw_response, token_budget)
+                self.token_budget.record(complexity, len(prompt), response_data, token_budget, truncated)
+                if not truncated:
+                    break
+                
+                logger.warning(f"Generation truncated at num_predict={token_budget['num_predict']}, retrying with a larger budget")
+                token_budget = self.token_budget.expand(token_budget)
+                if emit:
+                    emit("retry", {"reason": "truncated", "token_budget": token_budget})
+            
+            generation_time = time.time() - start_time
+            
+            logger.info(f"Raw model response: {raw_response}")
+            logger.info(f"Generation time: {generation_time:.2f}s, Tokens used: {tokens_used}")
+            
+            # Extract SQL query
+            sql_query = self.extract_sql_query(raw_response)
+            
+            return {
+                "sql_query": sql_query,
+                "execution_time": generation_time,
+                "generation_time": generation_time,
+                "tokens_used": tokens_used,
+                "token_budget": token_budget,
+                "follow_up": follow_up
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating SQL: {str(e)}")
+            return {"error": f"SQL Generation Error: {str(e)}"}
     
-    def generate_sql_node(self, state: AgentState) -> AgentState:
-        """Generate SQL from natural language question"""
-        question = state.get("question", "")
-        complexity = state.get("query_complexity", "simple")
+    def generate_speculative(self, prompt, candidates, complexity, token_budget, question, target, emit=None):
+        """Generate several candidates in parallel and keep the cheapest one that validates and plans"""
+        def check(raw_response):
+            sql_query = self.extract_sql_query(raw_response)
+            error, _ = self.check_sql(sql_query, question, target)
+            if error:
+                return sql_query, error, None
+            # EXPLAIN catches what the parser can't (types, ambiguous columns) and prices the plan
+            try:
+                return sql_query, None, explain_cost(target, sql_query)
+            except Exception as e:
+                return sql_query, f"EXPLAIN failed: {str(e)}", None
+        
+        def on_candidate(candidate):
+            if emit:
+                emit("candidate", {key: candidate[key] for key in ("index", "temperature", "valid", "cost", "error")})
+        
+        options = {"num_ctx": token_budget["num_ctx"], "num_predict": token_budget["num_predict"]}
+        start_time = time.time()
+        try:
+            best, finished = self.speculative.run(prompt, options, candidates, check, on_candidate=on_candidate)
+        except Exception as e:
+            logger.error(f"Error generating SQL: {str(e)}")
+            return {"error": f"SQL Generation Error: {str(e)}"}
+        generation_time = time.time() - start_time
+        
+        for candidate in finished:
+            response_data = candidate["response_data"]
+            if response_data:
+                raw_response = response_data.get("response", "").strip()
+                truncated = self.token_budget.is_truncated(response_data, raw_response, token_budget)
+                self.token_budget.record(complexity, len(prompt), response_data, token_budget, truncated)
+        
+        report = [
+            {key: candidate[key] for key in ("index", "temperature", "valid", "cost", "error", "generation_time")}
+            for candidate in finished
+        ]
+        logger.info(f"{len(finished)}/{candidates} candidates finished in {generation_time:.2f}s, "
+                    f"{sum(1 for candidate in finished if candidate['valid'])} valid")
+        
+        # With no valid candidate, hand the first one on so validation reports a concrete reason
+        chosen = best or next((candidate for candidate in finished if candidate["sql_query"]), None)
+        if chosen is None:
+            error = finished[0]["error"] if finished else "no candidate finished"
+            return {"error": f"SQL Generation Error: {error}", "candidate_report": report}
         
+        return {
+            "sql_query": chosen["sql_query"],
+            "execution_time": generation_time,
+            "generation_time": generation_time,
+            "tokens_used": sum(candidate["tokens_used"] for candidate in finished),
+            "token_budget": token_budget,
+            "candidate_report": report
+        }
+    
+    def previous_turn(self, state: AgentState, target) -> Optional[Dict]:
+        """The conversation's last answer when the question refines it on the same target"""
+        conversation_id = state.get("conversation_id")
+        if not conversation_id or not is_follow_up(state.get("question", "")):
+            return None
+        turn = self.conversations.get(conversation_id)
+        if turn is None or turn["target"] != target.name:
+            return None
+        return turn
+    
+    def build_edit_prompt(self, question: str, previous: Dict, target, mentions: Optional[List[Dict]] = None) -> str:
+        """Short prompt that edits the previous SQL: only the tables it reads, no mappings or examples"""
+        tables = target.get_tables()
+        used = sorted(table for table in parse_sql(previous["sql"]).tables if table in tables)
+        schema = "\n        ".join(f"- {table} ({', '.join(tables[table])})" for table in used)
+        
+        return f"""
+        You are a SQL expert. Edit the previous {target.dialect} SELECT query so it answers the follow-up question.
+
+        Tables:
+        {schema}
+
+        Previous Question: "{previous['question']}"
+        Previous SQL: {" ".join(previous["sql"].split())}
+
+        Natural Language Question: "{question}"
+        {self.format_mentions(mentions)}
+        Change only what the follow-up asks for. Return only the edited SQL query, with no explanations or markdown.
+
+        SQL Query:
+        """
+    
+    def find_examples(self, question: str, target_name: str) -> List[Dict]:
+        """Most similar answered questions for this target, within the few-shot token budget"""
+        if settings.QUERYCRAFT_FEW_SHOT_K <= 0:
+            return []
+        if not self.example_store.loaded and settings.QUERYCRAFT_PERSIST_HISTORY:
+            self.example_store.load_from_history()
+        return self.example_store.similar(
+            question, target_name, k=settings.QUERYCRAFT_FEW_SHOT_K, token_budget=settings.QUERYCRAFT_FEW_SHOT_TOKENS
+        )
+    
+    def format_examples(self, examples: List[Dict]) -> str:
+        shots = []
+        for example in examples:
+            sql_query = " ".join(example["sql"].split()).rstrip(";")
+            shots.append(f'EXAMPLE: For "{example["question"]}", generate:\n        {sql_query};')
+        return "\n\n        ".join(shots)
+    
+    def format_mentions(self, mentions: Optional[List[Dict]]) -> str:
+        """Prompt lines giving the stored spelling of values the question may refer to; empty when there are none"""
+        if not mentions:
+            return ""
+        lines = ["Stored values that may match words in the question. Only filter on one if the question "
+                 "actually refers to it, and then use the stored spelling:"]
+        for mention in mentions:
+            value = mention["value"].replace("'", "''")
+            lines.append(f'- If "{mention["mentioned_as"]}" refers to {mention["table"]}.{mention["column"]}, '
+                         f'the stored value is \'{value}\'')
+        return "\n        " + "\n        ".join(lines) + "\n"
+    
+    def build_prompt(self, question: str, complexity: str, target, examples: Optional[List[Dict]] = None,
+                     mentions: Optional[List[Dict]] = None) -> str:
+        """Generation prompt; the application database keeps its curated mappings"""
         # Adjust prompt based on query complexity
         complexity_instructions = {
             "simple": "Generate a simple SELECT query.",
@@ -131,14 +391,34 @@ class QueryCraftLangGraphAgent:
             "complex": "Generate a complex SELECT query that may include multiple joins, subqueries, or window functions."
         }
         
+        if not target.is_default:
+            return f"""
+        You are a SQL expert. Convert this natural language question to a {target.dialect} SELECT query only.
+
+        Database Schema:
+        {target.describe_schema()}
+
+        Natural Language Question: "{question}"
+
+        IMPORTANT INSTRUCTIONS:
+        1. Generate ONLY a valid {target.dialect} SELECT query
+        2. {complexity_instructions[complexity]}
+        3. Do NOT include any explanations, comments, or additional text
+        4. Do NOT use markdown formatting
+        5. Return only the pure SQL query
+        6. Use only the tables and columns listed in the schema above
+
+        {self.format_examples(examples) if examples else ""}
+
+        SQL Query:
+        """
+        
         # Enhanced prompt with specific column mappings and examples
-        prompt = f"""
+        return f"""
         You are a SQL expert. Convert this natural language question to a PostgreSQL SELECT query only.
 
         Database Schema:
-        - core_customer (id, name, email, registration_date)
-        - core_product (id, name, category, price) 
-        - core_order (id, customer_id, product_id, order_date, quantity, status)
+        {target.describe_schema()}
 
         CRITICAL COLUMN MAPPINGS:
         - "most expensive" or "highest price" should map to the "price" column in core_product
@@ -148,7 +428,7 @@ class QueryCraftLangGraphAgent:
         - "order" refers to core_order table
 
         Natural Language Question: "{question}"
-
+        {self.format_mentions(mentions)}
         IMPORTANT INSTRUCTIONS:
         1. Generate ONLY a valid PostgreSQL SELECT query
         2. {complexity_instructions[complexity]}
@@ -161,50 +441,10 @@ class QueryCraftLangGraphAgent:
         9. For quantity-related questions, use the quantity column from core_order
         10. For date-related queries, use appropriate date functions like CURRENT_DATE, INTERVAL, etc.
 
-        EXAMPLE: For "What is the most expensive product?", generate:
-        SELECT name, price FROM core_product ORDER BY price DESC LIMIT 1;
-
-        EXAMPLE: For "How many customers registered last month?", generate:
-        SELECT COUNT(*) FROM core_customer WHERE registration_date >= CURRENT_DATE - INTERVAL '1 month';
+        {self.format_examples(examples or DEFAULT_EXAMPLES)}
 
         SQL Query:
         """
-        
-        payload = {
-            "model": "sqlcoder:7b",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "num_ctx": 4096 if complexity == "complex" else 2048,
-                "num_predict": 512 if complexity == "complex" else 256
-            }
-        }
-        
-        try:
-            start_time = time.time()
-            response = requests.post(self.ollama_url, json=payload, timeout=120)
-            response_data = response.json()
-            generation_time = time.time() - start_time
-            
-            raw_response = response_data.get("response", "").strip()
-            tokens_used = response_data.get("eval_count", 0)
-            
-            logger.info(f"Raw model response: {raw_response}")
-            logger.info(f"Generation time: {generation_time:.2f}s, Tokens used: {tokens_used}")
-            
-            # Extract SQL query
-            sql_query = self.extract_sql_query(raw_response)
-            
-            return {
-                "sql_query": sql_query,
-                "execution_time": generation_time,
-                "tokens_used": tokens_used
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating SQL: {str(e)}")
-            return {"error": f"SQL Generation Error: {str(e)}"}
     
     def validate_sql_node(self, state: AgentState) -> AgentState:
         """Validate the generated SQL query"""
@@ -214,29 +454,18 @@ class QueryCraftLangGraphAgent:
         if not sql_query:
             return {"validation_result": "invalid", "error": "No SQL query generated"}
         
-        # Convert to uppercase for validation
-        upper_query = sql_query.upper()
-        
-        # Check if it's a SELECT statement
-        if not upper_query.startswith('SELECT'):
-            return {"validation_result": "invalid", "error": "Generated query is not a SELECT statement"}
-        
-        # Check for unauthorized operations
-        dangerous_operations = ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'GRANT', 'REVOKE']
-        if any(keyword in upper_query for keyword in dangerous_operations):
-            return {"validation_result": "invalid", "error": "Generated query contains unauthorized SQL operations"}
+        if state.get("follow_up") == "local":
+            # The rows were refined in memory from an answer whose SQL already passed validation;
+            # the wrapper's columns (an unaliased COUNT(*) is "count") aren't known to the validator
+            return {"validation_result": "valid", "referenced_tables": sorted(parse_sql(sql_query).tables)}
         
-        # Check for essential SQL components
-        if 'FROM' not in upper_query:
-            return {"validation_result": "invalid", "error": "Generated query missing FROM clause"}
+        target = get_target(state.get("target"))
         
-        # Additional validation for query intent
-        if "expensive" in question or "price" in question or "cost" in question:
-            if "PRICE" not in upper_query:
-                return {"validation_result": "invalid", "error": "Query about price but doesn't reference price column"}
+        error, parsed = self.check_sql(sql_query, question, target)
+        if error:
+            return {"validation_result": "invalid", "error": error}
         
-        if "quantity" in question and "QUANTITY" not in upper_query:
-            return {"validation_result": "invalid", "error": "Query about quantity but doesn't reference quantity column"}
+        upper_query = sql_query.upper()
         
         # Additional validation for complex queries
         complexity = state.get("query_complexity", "simple")
@@ -250,33 +479,101 @@ class QueryCraftLangGraphAgent:
             if not has_complex_features:
                 logger.warning("Query marked as complex but doesn't use complex features")
         
-        return {"validation_result": "valid"}
+        return {"validation_result": "valid", "referenced_tables": sorted(parsed.tables)}
+    
+    def check_sql(self, sql_query: str, question: str, target):
+        """Return (error or None, parsed statement) for a candidate answer to question on target"""
+        question = question.lower()
+        
+        # Parse once (cached per SQL string) and enforce a single read-only statement over known tables
+        try:
+            parsed = validate_sql(sql_query, target.get_tables())
+        except SQLValidationError as e:
+            return str(e), None
+        except Exception as e:
+            return f"Schema Error: {str(e)}", None
+        
+        upper_query = sql_query.upper()
+        
+        # Additional validation for query intent (column names of the application schema)
+        if target.is_default and ("expensive" in question or "price" in question or "cost" in question):
+            if "PRICE" not in upper_query:
+                return "Query about price but doesn't reference price column", parsed
+        
+        if target.is_default and "quantity" in question and "QUANTITY" not in upper_query:
+            return "Query about quantity but doesn't reference quantity column", parsed
+        
+        return None, parsed
     
     def execute_sql_node(self, state: AgentState) -> AgentState:
         """Execute the validated SQL query against the database"""
         sql_query = state.get("sql_query", "")
+        page_size = state.get("page_size")
+        target = get_target(state.get("target"))
+        truncated = False
+        results, approximation, cached_at = None, None, None
+        
+        if state.get("follow_up") == "local":
+            self.save_turn(state, state.get("execution_result") or [], target)
+            return {"validation_result": "valid", "next_cursor": None}
         
         try:
             start_time = time.time()
-            with connection.cursor() as cursor:
-                cursor.execute(sql_query)
+            with target.cursor() as cursor:
+                if state.get("mode") == "approximate":
+                    # Falls back to running the query as written when it can't be estimated
+                    results, approximation = run_approximation(
+                        cursor, target.vendor, sql_query,
+                        min_rows=settings.QUERYCRAFT_APPROXIMATE_MIN_ROWS,
+                        sample_rows=settings.QUERYCRAFT_APPROXIMATE_SAMPLE_ROWS
+                    )
                 
-                # Get column names
-                columns = [col[0] for col in cursor.description] if cursor.description else []
-                
-                # Get results
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
+                if results is not None:
+                    next_cursor = None
+                elif page_size:
+                    results, next_cursor, truncated = self.fetch_keyset_page(cursor, sql_query, page_size, target=target)
+                else:
+                    # Literals become parameters: one cache entry and one server-side plan per query shape
+                    query = parameterize_sql(sql_query) if settings.QUERYCRAFT_PARAMETERIZE_SQL else None
+                    cache_key = query.cache_key if query else sql_query
+                    cached = self.answer_cache.get_result(cache_key, target.name)
+                    if cached is not None:
+                        results, cached_at = cached
+                    else:
+                        if query:
+                            execute_parameterized(cursor, target.connection, query,
+                                                  max_statements=settings.QUERYCRAFT_MAX_PREPARED_STATEMENTS)
+                        else:
+                            cursor.execute(sql_query)
+                        results = self.fetch_rows(cursor, target.max_rows)
+                        truncated = bool(target.max_rows) and len(results) > target.max_rows
+                        if truncated:
+                            logger.warning(f"Result cut to the {target.max_rows} row limit of target {target.name}")
+                            results = results[:target.max_rows]
+                        else:
+                            self.answer_cache.set_result(cache_key, results, target.name)
+                    next_cursor = None
                 
                 execution_time = time.time() - start_time
                 
-                logger.info(f"Query executed successfully in {execution_time:.2f}s, returned {len(results)} results")
+                # Only SQL that validated and ran is worth answering the same question with again
+                if not state.get("cache_hit") and not state.get("follow_up"):
+                    self.answer_cache.set_sql(state.get("question", ""), sql_query, target.name)
+                    self.example_store.add(state.get("question", ""), sql_query, target.name)
+                
+                # A page, a cut-off result or an estimate can't stand in for the full rows of a later refinement
+                self.save_turn(state, None if page_size or truncated or approximation else results, target)
+                
+                logger.info(f"Query executed successfully on {target.name} in {execution_time:.2f}s, returned {len(results)} results")
                 
                 return {
                     "execution_result": results,
                     "validation_result": "valid",
-                    "execution_time": execution_time
+                    "execution_time": execution_time,
+                    "next_cursor": next_cursor,
+                    "rows_truncated": truncated,
+                    "approximation": approximation,
+                    "result_cached_at": cached_at
                 }
                 
         except Exception as e:
@@ -286,6 +583,113 @@ class QueryCraftLangGraphAgent:
                 "validation_result": "invalid"
             }
     
+    def save_turn(self, state: AgentState, rows: Optional[List[Dict]], target):
+        conversation_id = state.get("conversation_id")
+        if conversation_id:
+            self.conversations.save(conversation_id, state.get("question", ""), state.get("sql_query", ""),
+                                    target.name, rows)
+    
+    def fetch_rows(self, cursor, max_rows: int = 0) -> List[Dict]:
+        """Read the rows of an executed cursor as dicts keyed by column name
+        
+        With max_rows, at most max_rows + 1 rows are read so the caller can tell the result was cut.
+        """
+        columns = [col[0] for col in cursor.description] if cursor.description else []
+        rows = cursor.fetchmany(max_rows + 1) if max_rows else cursor.fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def fetch_keyset_page(self, cursor, sql_query, page_size, key=None, after=None, target=None):
+        """Run one keyset page of sql_query; returns the rows, the cursor for the next page and whether rows were cut
+
+        A result that can't be paged safely comes back whole, up to the target's row limit.
+        """
+        target = target or get_target()
+        
+        if key is None:
+            # Output columns decide the key: the query's ORDER BY first, then columns that make rows unique
+            inner = strip_terminator(sql_query)
+            cursor.execute(f"SELECT * FROM ({inner}) AS qc_page LIMIT 0")
+            columns = [col[0] for col in cursor.description]
+            key = build_key(parse_order_by(sql_query), columns,
+                            unique_columns(sql_query, columns, self.primary_keys(cursor, target, sql_query)))
+            
+            if key is not None:
+                # NULL never compares greater than anything, so a NULL key value would end the cursor chain early
+                quote_name = target.connection.ops.quote_name
+                nullable = " OR ".join(f"{quote_name(column)} IS NULL" for column, _ in key)
+                cursor.execute(f"SELECT 1 FROM ({inner.replace('%', '%%')}) AS qc_page WHERE {nullable} LIMIT 1", [])
+                if cursor.fetchone() is not None:
+                    key = None
+            
+            if key is None:
+                logger.warning("No unique, non-NULL keyset for this result, returning it without a cursor")
+                cursor.execute(sql_query)
+                rows = self.fetch_rows(cursor, target.max_rows)
+                truncated = bool(target.max_rows) and len(rows) > target.max_rows
+                if truncated:
+                    logger.warning(f"Result cut to the {target.max_rows} row limit of target {target.name}")
+                    rows = rows[:target.max_rows]
+                return rows, None, truncated
+        
+        page_sql, params = paginated_sql(sql_query, key, target.connection.ops.quote_name, after=after)
+        cursor.execute(page_sql, params + [page_size + 1])
+        rows = self.fetch_rows(cursor)
+        
+        # One extra row tells us whether another page exists without a COUNT
+        if len(rows) <= page_size:
+            return rows, None, False
+        
+        rows = rows[:page_size]
+        return rows, encode_cursor(sql_query, key, rows[-1], page_size, target=target.name), False
+    
+    def primary_keys(self, cursor, target, sql_query: str) -> Dict[str, Optional[str]]:
+        """Primary key column of each table sql_query reads"""
+        introspection = target.connection.introspection
+        keys = {}
+        for table in parse_sql(sql_query).tables:
+            try:
+                keys[table] = introspection.get_primary_key_column(cursor, table)
+            except Exception:
+                keys[table] = None
+        return keys
+    
+    def fetch_page(self, cursor_token: str):
+        """Continue a paginated answer from its cursor without calling the model again"""
+        try:
+            page = decode_cursor(cursor_token, max_age=settings.QUERYCRAFT_CURSOR_MAX_AGE)
+        except signing.BadSignature:
+            return {"error": "Invalid or expired cursor"}
+        
+        # The SQL is signed, but the schema may have changed since the cursor was issued
+        try:
+            target = get_target(page.get("target"))
+            validate_sql(page["sql"], target.get_tables())
+        except SQLValidationError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            return {"error": f"Schema Error: {str(e)}"}
+        
+        try:
+            start_time = time.time()
+            with target.cursor() as cursor:
+                results, next_cursor, _ = self.fetch_keyset_page(
+                    cursor, page["sql"], page["page_size"],
+                    key=[tuple(item) for item in page["key"]], after=page["last"], target=target
+                )
+        except Exception as e:
+            logger.error(f"SQL Execution Error: {str(e)}")
+            return {"error": f"SQL Execution Error: {str(e)}"}
+        
+        return {
+            "sql_query": page["sql"],
+            "execution_result": results,
+            "validation_result": "valid",
+            "execution_time": time.time() - start_time,
+            "page_size": page["page_size"],
+            "next_cursor": next_cursor,
+            "target": target.name
+        }
+    
     def handle_error_node(self, state: AgentState) -> AgentState:
         """Handle error state"""
         error_msg = state.get("error", "Unknown error occurred")
@@ -299,6 +703,10 @@ class QueryCraftLangGraphAgent:
         error = state.get("error")
         execution_time = state.get("execution_time", 0)
         
+        # Background runs (cache pre-warming) must not count as user traffic
+        if not state.get("record_history", True):
+            return state
+        
         # Add to history
         self.query_history.add_entry(
             question=question,
@@ -308,60 +716,134 @@ class QueryCraftLangGraphAgent:
             error=error
         )
         
+        if settings.QUERYCRAFT_PERSIST_HISTORY:
+            self.persist_history(state)
+        
+        # Periodically refit the optional learned complexity model on what actually got generated
+        if settings.QUERYCRAFT_COMPLEXITY_MODEL == "linear":
+            self.entries_since_training += 1
+            if self.entries_since_training >= settings.QUERYCRAFT_COMPLEXITY_RETRAIN_EVERY:
+                self.entries_since_training = 0
+                self.complexity_classifier.train_from_history(self.query_history.get_history(None))
+        
         return state
     
+    def persist_history(self, state: AgentState):
+        """Store the question in the database so frequent ones survive restarts (used for cache pre-warming)"""
+        question = state.get("question", "")
+        try:
+            QueryLog.objects.create(
+                question=question,
+                normalized_question=normalize_question(question)[:500],
+                target=state.get("target") or "default",
+                sql_query=state.get("sql_query") or "",
+                error=state.get("error"),
+                follow_up=bool(state.get("follow_up")),
+                query_complexity=state.get("query_complexity") or "",
+                execution_time=state.get("execution_time") or 0,
+                tokens_used=state.get("tokens_used") or 0
+            )
+        except Exception as e:
+            logger.warning(f"Could not persist query history: {str(e)}")
+    
     def decide_after_validation(self, state: AgentState) -> Literal["valid", "invalid"]:
         """Decision function for conditional edge"""
         return state.get("validation_result", "invalid")
     
     def extract_sql_query(self, text: str) -> str:
         """Extract SQL query from model response"""
-        # Remove any markdown code blocks
-        text = re.sub(r'```sql|```', '', text)
-        
-        # Look for SQL statements
-        sql_patterns = [
-            r'(SELECT.*?;)',  # SELECT statements ending with ;
-            r'(SELECT.*?)(?=SELECT|$)',  # SELECT statements without ;
-            r'(SELECT.*?FROM.*?WHERE.*?)',  # SELECT with WHERE
-            r'(SELECT.*?FROM.*?)',  # Basic SELECT
-        ]
-        
-        for pattern in sql_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.DOTALL)
-            if matches:
-                # Clean up the query
-                query = matches[0].strip()
-                # Ensure it ends with a semicolon
-                if not query.endswith(';'):
-                    query += ';'
-                return query
-        
-        # If no SQL pattern found, try to clean up and return the whole text
-        cleaned_text = re.sub(r'[^a-zA-Z0-9\s_,.*=()\'\-\+]', ' ', text).strip()
-        if cleaned_text and any(word in cleaned_text.upper() for word in ['SELECT', 'FROM', 'WHERE']):
-            if not cleaned_text.endswith(';'):
-                cleaned_text += ';'
-            return cleaned_text
-        
-        return text.strip()
-    
-    def process_question(self, question: str):
+        sql_query = sql_extraction.extract_sql_query(text)
+        return sql_query if sql_query is not None else text.strip()
+    
+    def process_question(self, question: str, page_size: Optional[int] = None, record_history: bool = True,
+                         target: Optional[str] = None, candidates: Optional[int] = None, mode: Optional[str] = None,
+                         conversation_id: Optional[str] = None):
         """Process a natural language question through the workflow"""
-        initial_state = AgentState(question=question)
+        initial_state = AgentState(question=question, page_size=page_size, record_history=record_history,
+                                   target=target, candidates=candidates, mode=mode, conversation_id=conversation_id)
         
         try:
             result = self.workflow.invoke(initial_state)
             
             # Add some metadata to the response
             result["history_count"] = len(self.query_history.history)
-            result["query_complexity"] = initial_state.get("query_complexity", "simple")
+            result["query_complexity"] = result.get("query_complexity") or "simple"
             
             return result
         except Exception as e:
             logger.error(f"Workflow execution error: {str(e)}")
             return {"error": f"Workflow execution error: {str(e)}"}
     
+    def process_question_stream(self, question: str, preview_rows: int = 20, target: Optional[str] = None,
+                                candidates: Optional[int] = None, mode: Optional[str] = None,
+                                conversation_id: Optional[str] = None):
+        """Process a question and yield (event, data) pairs as each workflow node finishes"""
+        events = queue.Queue()
+        done = object()
+        
+        def emit(event, data):
+            events.put((event, data))
+        
+        def run():
+            state = {"question": question, "target": target, "conversation_id": conversation_id}
+            try:
+                config = {"configurable": {"emit": emit}}
+                initial_state = AgentState(question=question, target=target, candidates=candidates, mode=mode,
+                                           conversation_id=conversation_id)
+                for step in self.workflow.stream(initial_state, config=config):
+                    for node, output in step.items():
+                        output = output or {}
+                        state.update(output)
+                        self._emit_node_event(emit, node, output, preview_rows)
+                
+                state["history_count"] = len(self.query_history.history)
+                state["query_complexity"] = state.get("query_complexity") or "simple"
+            except Exception as e:
+                logger.error(f"Workflow execution error: {str(e)}")
+                state = {"error": f"Workflow execution error: {str(e)}"}
+            finally:
+                connections.close_all()
+            
+            events.put(("result", state))
+            events.put(done)
+        
+        threading.Thread(target=run, name="querycraft-stream", daemon=True).start()
+        
+        while True:
+            item = events.get()
+            if item is done:
+                return
+            yield item
+    
+    def _emit_node_event(self, emit, node, output, preview_rows):
+        """Translate a finished node's state update into a progress event"""
+        if node == "analyze_complexity":
+            emit("complexity", {
+                "query_complexity": output.get("query_complexity"),
+                "token_budget": output.get("token_budget")
+            })
+        elif node == "generate_sql":
+            emit("sql", {
+                "sql": output.get("sql_query"),
+                "generation_time": output.get("generation_time"),
+                "tokens_used": output.get("tokens_used"),
+                "error": output.get("error")
+            })
+        elif node == "validate_sql":
+            emit("validation", {
+                "validation": output.get("validation_result"),
+                "error": output.get("error")
+            })
+        elif node == "execute_sql":
+            rows = output.get("execution_result") or []
+            emit("rows", {
+                "rows": rows[:preview_rows],
+                "row_count": len(rows),
+                "execution_time": output.get("execution_time"),
+                "approximation": output.get("approximation"),
+                "error": output.get("error")
+            })
+    
     def get_query_history(self, limit=10):
         """Get query history"""
         return self.query_history.get_history(limit)
@@ -389,5 +871,6 @@ class QueryCraftLangGraphAgent:
             "successful_queries": len(successful_queries),
             "failed_queries": len(failed_queries),
             "avg_execution_time": round(avg_execution_time, 2),
-            "total_execution_time": round(total_execution_time, 2)
+            "total_execution_time": round(total_execution_time, 2),
+            "token_budget": self.token_budget.get_stats()
         }
\ No newline at end of file
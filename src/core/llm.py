@@ -0,0 +1,64 @@
+import json
+import logging
+import threading
+from typing import Callable, Dict, Optional
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    """Raised when a streaming generation is stopped through its cancel event"""
+
+
+class OllamaClient:
+    """Thin wrapper over Ollama's /api/generate, optionally streaming tokens to a callback"""
+
+    def __init__(self, url: str, model: str = "sqlcoder:7b", timeout: int = 120):
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+
+    def generate(self, prompt: str, options: Dict, on_token: Optional[Callable[[str], None]] = None,
+                 cancel_event: Optional[threading.Event] = None) -> Dict:
+        """Run one generation and return Ollama's final response object with the full text in "response"
+
+        A cancel_event forces streaming; setting it closes the connection, which makes
+        Ollama stop generating, and raises GenerationCancelled.
+        """
+        stream = on_token is not None or cancel_event is not None
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": options
+        }
+
+        if not stream:
+            response = requests.post(self.url, json=payload, timeout=self.timeout)
+            return response.json()
+
+        # Streaming: one JSON object per line, the last one carries done=true and the token counts
+        response = requests.post(self.url, json=payload, timeout=self.timeout, stream=True)
+        pieces = []
+        final = {}
+        try:
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    raise GenerationCancelled()
+                if not line:
+                    continue
+                data = json.loads(line)
+                piece = data.get("response", "")
+                if piece:
+                    pieces.append(piece)
+                    if on_token is not None:
+                        on_token(piece)
+                if data.get("done"):
+                    final = data
+                    break
+        finally:
+            response.close()
+
+        final["response"] = "".join(pieces)
+        return final
@@ -0,0 +1,86 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from core.answer_cache import AnswerCache
+from core.examples import ExampleStore
+from core.evaluation import EVAL_CORPUS, FakeLLM, evaluate_item, summarize
+from core.langgraph_agent import QueryCraftLangGraphAgent
+
+class Command(BaseCommand):
+    help = 'Scores the agent against gold SQL over the seeded schema: execution accuracy, latency and tokens per tier'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=['fake', 'ollama'], default='fake',
+            help='fake answers with the gold SQL (pipeline check); ollama uses the configured model'
+        )
+        parser.add_argument('--lang', choices=['en', 'fa'], help='Only evaluate questions in this language')
+        parser.add_argument('--tier', choices=['simple', 'medium', 'complex'], help='Only evaluate this tier')
+        parser.add_argument('--limit', type=int, help='Evaluate at most this many questions')
+        parser.add_argument('--candidates', type=int, help='Speculative candidates per question')
+        parser.add_argument('--fake-noise', type=float, default=0.0, help='Fraction of deliberately wrong fake answers')
+        parser.add_argument('--fake-latency', type=float, default=0.0, help='Seconds each fake generation takes')
+        parser.add_argument('--use-cache', action='store_true', help='Allow answer cache hits (off by default)')
+        parser.add_argument(
+            '--few-shot', action='store_true',
+            help='Let earlier correct answers in this run become few-shot examples (history is never used)'
+        )
+        parser.add_argument('--json', dest='json_path', help='Also write every record and the summary to this file')
+        parser.add_argument('--verbose', action='store_true', help='Print the SQL of every wrong answer')
+
+    def handle(self, *args, **options):
+        corpus = [
+            item for item in EVAL_CORPUS
+            if (not options['lang'] or item['lang'] == options['lang'])
+            and (not options['tier'] or item['tier'] == options['tier'])
+        ][:options['limit']]
+        if not corpus:
+            raise CommandError('No questions match the given filters')
+
+        agent = QueryCraftLangGraphAgent()
+        agent.answer_cache = AnswerCache(enabled=options['use_cache'])
+        # Persisted history may hold the corpus questions themselves; a store that keeps nothing uses the static shots
+        agent.example_store = ExampleStore(max_examples=1000 if options['few_shot'] else 0)
+        agent.example_store.loaded = True
+        if options['model'] == 'fake':
+            agent.llm = FakeLLM(EVAL_CORPUS, noise=options['fake_noise'], latency=options['fake_latency'])
+            agent.speculative.llm = agent.llm
+
+        records = []
+        for item in corpus:
+            record = evaluate_item(agent, item, candidates=options['candidates'])
+            records.append(record)
+
+            if record.get('skipped'):
+                mark = 'SKIP'
+            else:
+                mark = 'ok' if record['correct'] else 'FAIL'
+            self.stdout.write(f"{mark:<5}{record['tier']:<9}{record['total_time']:>7.2f}s  {item['question']}")
+            if record['error']:
+                self.stdout.write(f"       {record['error']}")
+            elif options['verbose'] and not record['correct']:
+                self.stdout.write(f"       {record['sql']}")
+
+        summary = summarize(records)
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'tier':<9}{'n':>4}{'accuracy':>10}{'errors':>8}{'tier agr.':>11}"
+            f"{'gen p50':>9}{'gen p95':>9}{'exec p50':>10}{'total p95':>11}{'tokens':>8}"
+        )
+        for tier in ('simple', 'medium', 'complex', 'all'):
+            row = summary.get(tier)
+            if not row:
+                continue
+            self.stdout.write(
+                f"{tier:<9}{row['questions']:>4}{row['accuracy']:>10.0%}{row['errors']:>8}{row['tier_agreement']:>11.0%}"
+                f"{row['generation_p50']:>8.2f}s{row['generation_p95']:>8.2f}s{row['execution_p50']:>9.3f}s"
+                f"{row['total_p95']:>10.2f}s{row['avg_tokens']:>8.0f}"
+            )
+
+        skipped = sum(1 for record in records if record.get('skipped'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"{skipped} questions skipped because their gold SQL failed"))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump({'summary': summary, 'records': records}, f, ensure_ascii=False, indent=2, default=str)
+            self.stdout.write(f"Wrote {options['json_path']}")
@@ -0,0 +1,35 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.prewarm import prewarm_cache
+from core.views import agent
+
+class Command(BaseCommand):
+    help = 'Regenerates the most frequent questions from history to fill the answer cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=settings.QUERYCRAFT_PREWARM_LIMIT,
+            help='Number of most frequent questions to warm'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.QUERYCRAFT_PREWARM_CONCURRENCY,
+            help='Questions generated at the same time'
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        report = prewarm_cache(agent, options['limit'], options['concurrency'])
+
+        if not report:
+            self.stdout.write('No successful questions in history to warm')
+            return
+
+        for item in report:
+            status = f"error: {item['error']}" if item['error'] else ('cached' if item['cache_hit'] else 'generated')
+            self.stdout.write(f"{item['time']:>7.2f}s  {status:<12} [{item['target']}] {item['question']}")
+
+        warmed = sum(1 for item in report if not item['error'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {warmed}/{len(report)} questions in {time.time() - start_time:.2f}s"
+        ))
@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.schema_catalog import refresh_rollups
+
+class Command(BaseCommand):
+    help = 'Refreshes the materialized order rollups, once or on a fixed schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and refresh every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.QUERYCRAFT_ROLLUP_REFRESH_INTERVAL,
+            help='Seconds between refreshes when --loop is given'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            start_time = time.time()
+            refreshed = refresh_rollups()
+            if refreshed:
+                self.stdout.write(f"Refreshed {', '.join(refreshed)} in {time.time() - start_time:.2f}s")
+            else:
+                self.stdout.write('No rollups to refresh (PostgreSQL only)')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
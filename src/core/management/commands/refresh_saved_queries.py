@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.models import SavedQuery
+from core.saved_queries import refresh_due_queries, refresh_saved_query
+
+class Command(BaseCommand):
+    help = 'Refreshes saved queries that are due, once or on a fixed schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help='Refresh only this saved query, whether due or not')
+        parser.add_argument('--full', action='store_true', help='Recompute from scratch instead of incrementally')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and check for due queries every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.QUERYCRAFT_SAVED_QUERY_POLL_INTERVAL,
+            help='Seconds between checks when --loop is given'
+        )
+
+    def handle(self, *args, **options):
+        if options['name']:
+            saved = SavedQuery.objects.filter(name=options['name']).first()
+            if saved is None:
+                raise CommandError(f"No saved query named '{options['name']}'")
+            self.report([refresh_saved_query(saved, full=options['full'])])
+            return
+
+        while True:
+            self.report(refresh_due_queries(full=options['full']))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, refreshed):
+        for saved in refreshed:
+            status = f"error: {saved.last_error}" if saved.last_error else f"{saved.row_count} rows"
+            self.stdout.write(f"{saved.refresh_time:>7.2f}s  {saved.refresh_strategy:<12} {saved.name}: {status}")
+        if not refreshed:
+            self.stdout.write('No saved queries due')
@@ -0,0 +1,83 @@
+# Generated by Django 3.2.12 on 2026-10-19 09:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+CREATE_ROLLUPS_SQL = [
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS core_daily_order_rollup AS
+    SELECT o.order_date,
+           o.product_id,
+           o.status,
+           COUNT(*) AS order_count,
+           SUM(o.quantity) AS total_quantity,
+           SUM(o.quantity * p.price) AS revenue
+    FROM core_order o
+    JOIN core_product p ON p.id = o.product_id
+    GROUP BY o.order_date, o.product_id, o.status
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS core_daily_order_rollup_key "
+    "ON core_daily_order_rollup (order_date, product_id, status)",
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS core_category_revenue_rollup AS
+    SELECT o.order_date,
+           p.category,
+           o.status,
+           COUNT(*) AS order_count,
+           SUM(o.quantity) AS total_quantity,
+           SUM(o.quantity * p.price) AS revenue
+    FROM core_order o
+    JOIN core_product p ON p.id = o.product_id
+    GROUP BY o.order_date, p.category, o.status
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS core_category_revenue_rollup_key "
+    "ON core_category_revenue_rollup (order_date, category, status)",
+]
+
+DROP_ROLLUPS_SQL = [
+    "DROP MATERIALIZED VIEW IF EXISTS core_category_revenue_rollup",
+    "DROP MATERIALIZED VIEW IF EXISTS core_daily_order_rollup",
+]
+
+
+def create_rollups(apps, schema_editor):
+    # Materialized views are a PostgreSQL feature; other backends simply skip the rollups
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in CREATE_ROLLUPS_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_rollups(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in DROP_ROLLUPS_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='core_product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='core_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['order_date'], name='core_order_date_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='core_order_status_date_idx'),
+        ),
+        migrations.RunPython(create_rollups, drop_rollups),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.12 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_analytics_indexes_and_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField()),
+                ('normalized_question', models.CharField(db_index=True, max_length=500)),
+                ('sql_query', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('query_complexity', models.CharField(blank=True, max_length=10)),
+                ('execution_time', models.FloatField(default=0)),
+                ('tokens_used', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_querylog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querylog',
+            name='target',
+            field=models.CharField(default='default', max_length=100),
+        ),
+    ]
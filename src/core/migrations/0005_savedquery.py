@@ -0,0 +1,35 @@
+# Generated by Django 3.2.12 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_querylog_target'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(max_length=100, unique=True)),
+                ('question', models.TextField()),
+                ('sql_query', models.TextField()),
+                ('target', models.CharField(default='default', max_length=100)),
+                ('refresh_interval', models.PositiveIntegerField(default=3600)),
+                ('refresh_strategy', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental')], default='full', max_length=12)),
+                ('watermark', models.DateField(blank=True, null=True)),
+                ('base_result', models.BinaryField(null=True)),
+                ('result', models.BinaryField(null=True)),
+                ('row_count', models.IntegerField(default=0)),
+                ('refresh_time', models.FloatField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('last_refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_refresh_at', models.DateTimeField(blank=True, null=True)),
+                ('next_refresh_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-19 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_savedquery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querylog',
+            name='follow_up',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 class Customer(models.Model):
@@ -13,6 +14,12 @@ class Product(models.Model):
     category = models.CharField(max_length=50)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price'], name='core_product_cat_price_idx'),
+            models.Index(fields=['price'], name='core_product_price_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -23,5 +30,56 @@ class Order(models.Model):
     quantity = models.IntegerField()
     status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')])
 
+    class Meta:
+        indexes = [
+            # BRIN stays tiny on the append-mostly order_date range scans ("last month")
+            BrinIndex(fields=['order_date'], name='core_order_date_brin'),
+            models.Index(fields=['status', 'order_date'], name='core_order_status_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.id} by {self.customer.name}"
+
+class QueryLog(models.Model):
+    question = models.TextField()
+    normalized_question = models.CharField(max_length=500, db_index=True)
+    target = models.CharField(max_length=100, default='default')
+    sql_query = models.TextField(blank=True)
+    error = models.TextField(null=True, blank=True)
+    # Refinements of an earlier turn ("now only Books") don't stand on their own
+    follow_up = models.BooleanField(default=False)
+    query_complexity = models.CharField(max_length=10, blank=True)
+    execution_time = models.FloatField(default=0)
+    tokens_used = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
     def __str__(self):
-        return f"Order {self.id} by {self.customer.name}"
\ No newline at end of file
+        return self.question
+
+class SavedQuery(models.Model):
+    REFRESH_FULL = 'full'
+    REFRESH_INCREMENTAL = 'incremental'
+
+    name = models.SlugField(max_length=100, unique=True)
+    question = models.TextField()
+    sql_query = models.TextField()
+    target = models.CharField(max_length=100, default='default')
+    refresh_interval = models.PositiveIntegerField(default=3600)
+    refresh_strategy = models.CharField(
+        max_length=12, default=REFRESH_FULL,
+        choices=[(REFRESH_FULL, 'Full'), (REFRESH_INCREMENTAL, 'Incremental')]
+    )
+    # Aggregates over orders dated before the watermark, merged forward on each incremental refresh
+    watermark = models.DateField(null=True, blank=True)
+    base_result = models.BinaryField(null=True, editable=False)
+    result = models.BinaryField(null=True, editable=False)
+    row_count = models.IntegerField(default=0)
+    refresh_time = models.FloatField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    last_refreshed_at = models.DateTimeField(null=True, blank=True)
+    last_full_refresh_at = models.DateTimeField(null=True, blank=True)
+    next_refresh_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,189 @@
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .sql_validator import parse_sql
+
+logger = logging.getLogger(__name__)
+
+CURSOR_SALT = "querycraft.cursor"
+
+_ORDER_END_KEYWORDS = ("LIMIT", "OFFSET", "FETCH", "FOR")
+_DIRECTION_WORDS = ("ASC", "DESC", "NULLS", "FIRST", "LAST")
+
+
+class CursorJSONSerializer:
+    """signing serializer that accepts the Decimal and date values found in result keys"""
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), cls=DjangoJSONEncoder).encode("latin-1")
+
+    def loads(self, data):
+        return json.loads(data.decode("latin-1"))
+
+
+def encode_cursor(sql: str, key: List[Tuple[str, str]], last_row: Dict, page_size: int, **extra) -> Optional[str]:
+    """Opaque, signed token for the page after last_row; None when the key cannot continue"""
+    last = [last_row[column] for column, _ in key]
+    if any(value is None for value in last):
+        # NULL never compares greater than anything, so keyset paging cannot step past it
+        logger.warning("Cannot paginate past a NULL key value")
+        return None
+
+    payload = {"sql": sql, "key": key, "last": last, "page_size": page_size}
+    payload.update(extra)
+    return signing.dumps(payload, salt=CURSOR_SALT, serializer=CursorJSONSerializer, compress=True)
+
+
+def decode_cursor(token: str, max_age: Optional[int] = None) -> Dict:
+    """Verify and unpack a cursor; raises signing.BadSignature if it was tampered with"""
+    return signing.loads(token, salt=CURSOR_SALT, serializer=CursorJSONSerializer, max_age=max_age)
+
+
+def strip_terminator(sql: str) -> str:
+    return sql.strip().rstrip(";").strip()
+
+
+def _top_level_clause(tokens, keyword: str) -> Optional[int]:
+    """Index of the first token after a top-level `keyword BY`, or None"""
+    depth = 0
+    start = None
+    for index, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.upper == keyword and index + 1 < len(tokens) and tokens[index + 1].upper == "BY":
+            start = index + 2
+    return start
+
+
+def _column_reference(tokens) -> Optional[str]:
+    """Output name of a plain a / "A" / t.a reference, None for anything else"""
+    if len(tokens) == 1 and tokens[0].kind in ("word", "qident"):
+        return tokens[0].name
+    if len(tokens) == 3 and tokens[1].value == "." and tokens[2].kind in ("word", "qident"):
+        return tokens[2].name
+    return None
+
+
+def parse_order_by(sql: str) -> Optional[List[Tuple[str, str]]]:
+    """Top-level ORDER BY items as (column, ASC|DESC); [] without ORDER BY
+
+    None when any item is an expression or a position (ORDER BY SUM(x), ORDER BY 2):
+    only output columns can be keyset columns on the wrapped query, and
+    dropping an item would silently change the order.
+    """
+    tokens = [token for token in parse_sql(sql).tokens if token.value != ";"]
+    start = _top_level_clause(tokens, "ORDER")
+    if start is None:
+        return []
+
+    items = []
+    current = []
+    for token in tokens[start:] + [None]:
+        if token is not None and token.value != "," and token.upper not in _ORDER_END_KEYWORDS:
+            current.append(token)
+            continue
+
+        direction = "DESC" if any(t.upper == "DESC" for t in current) else "ASC"
+        column = _column_reference([t for t in current if t.upper not in _DIRECTION_WORDS])
+        if column is None:
+            return None
+        items.append((column, direction))
+
+        current = []
+        if token is None or token.value != ",":
+            break
+
+    return items
+
+
+def unique_columns(sql: str, columns: List[str], primary_keys: Dict[str, Optional[str]]) -> Optional[List[str]]:
+    """Output columns whose values identify a row of sql's result, or None when nothing is known to
+
+    A DISTINCT result is unique on all its columns, a GROUP BY result on its
+    grouping columns, and a single-table query on that table's primary key.
+    Joins can repeat a primary key, so they get no tie-breaker.
+    """
+    parsed = parse_sql(sql)
+    tokens = [token for token in parsed.tokens if token.value != ";"]
+    words = {token.upper for token in tokens}
+    if words & {"UNION", "INTERSECT", "EXCEPT"} or sum(1 for token in tokens if token.upper == "SELECT") > 1:
+        return None
+
+    if len(tokens) > 1 and tokens[1].upper == "DISTINCT" and not (len(tokens) > 2 and tokens[2].upper == "ON"):
+        return list(columns)
+
+    start = _top_level_clause(tokens, "GROUP")
+    if start is not None:
+        grouped = []
+        item = []
+        for token in tokens[start:] + [None]:
+            if token is not None and token.value != "," and token.upper not in ("HAVING", "ORDER", "LIMIT", "OFFSET",
+                                                                                    "FETCH", "WINDOW"):
+                item.append(token)
+                continue
+            column = _column_reference(item)
+            if column is None or column not in columns:
+                return None
+            grouped.append(column)
+            item = []
+            if token is None or token.value != ",":
+                break
+        return grouped
+
+    if len(parsed.tables) != 1 or "JOIN" in words:
+        return None
+    primary_key = primary_keys.get(next(iter(parsed.tables)))
+    return [primary_key] if primary_key and primary_key in columns else None
+
+
+def build_key(order_by: Optional[List[Tuple[str, str]]], columns: List[str],
+              unique: Optional[List[str]]) -> Optional[List[Tuple[str, str]]]:
+    """Keyset columns: the query's own ordering, then unique columns as the tie-breaker
+
+    None when the result can't be paged without losing or reordering rows:
+    duplicate output names, an ORDER BY item that isn't an output column, or
+    no unique tie-breaker (strictly-after comparisons would skip equal rows).
+    """
+    if order_by is None or not unique or len(set(columns)) != len(columns):
+        return None
+    if any(column not in columns for column, _ in order_by):
+        return None
+
+    key = list(order_by)
+    used = {column for column, _ in key}
+    key.extend((column, "ASC") for column in unique if column not in used)
+    return key
+
+
+def paginated_sql(sql: str, key: List[Tuple[str, str]], quote_name, after: Optional[List] = None,
+                  placeholder: str = "%s") -> Tuple[str, List]:
+    """Wrap sql so it returns rows strictly after `after` in key order
+
+    Mixed ASC/DESC keys are expanded into (a > x) OR (a = x AND b < y) ... so any
+    direction combination works without row-value comparisons. The caller appends
+    the LIMIT value to the returned params.
+    """
+    inner = strip_terminator(sql)
+    if placeholder == "%s":
+        # The statement now carries parameters, so literal % signs (LIKE '%x%') must be escaped
+        inner = inner.replace("%", "%%")
+    order = ", ".join(f"{quote_name(column)} {direction}" for column, direction in key)
+    params: List = []
+    where = ""
+
+    if after is not None:
+        disjuncts = []
+        for position, (column, direction) in enumerate(key):
+            terms = [f"{quote_name(prior)} = {placeholder}" for prior, _ in key[:position]]
+            terms.append(f"{quote_name(column)} {'<' if direction == 'DESC' else '>'} {placeholder}")
+            params.extend(after[:position])
+            params.append(after[position])
+            disjuncts.append("(" + " AND ".join(terms) + ")")
+        where = " WHERE " + " OR ".join(disjuncts)
+
+    return f"SELECT * FROM ({inner}) AS qc_page{where} ORDER BY {order} LIMIT {placeholder}", params
@@ -0,0 +1,70 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from django.db import connections
+from django.db.models import Count, Max
+
+from .models import QueryLog
+from .targets import get_targets
+
+logger = logging.getLogger(__name__)
+
+
+def top_questions(limit: int) -> List[Tuple[str, str]]:
+    """Most frequently asked (question, target) pairs that succeeded, one phrasing per normalized question"""
+    targets = set(get_targets())
+    rows = (
+        QueryLog.objects.filter(error__isnull=True, follow_up=False, target__in=targets)
+        .values("normalized_question", "target")
+        .annotate(asked=Count("id"), question=Max("question"))
+        .order_by("-asked", "normalized_question")[:limit]
+    )
+    return [(row["question"], row["target"]) for row in rows]
+
+
+def prewarm_cache(agent, limit: int = 20, concurrency: int = 2) -> List[Dict]:
+    """Regenerate, validate and run the top questions so their SQL and rows land in the answer cache"""
+    questions = top_questions(limit)
+    if not questions:
+        return []
+
+    def warm(item):
+        question, target = item
+        start_time = time.time()
+        try:
+            result = agent.process_question(question, record_history=False, target=target)
+        finally:
+            # Pool threads own their DB connections
+            connections.close_all()
+        return {
+            "question": question,
+            "target": target,
+            "error": result.get("error"),
+            "cache_hit": bool(result.get("cache_hit")),
+            "time": round(time.time() - start_time, 3),
+        }
+
+    # Bounded so warming never competes with live traffic for more than a few model slots
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="querycraft-prewarm") as executor:
+        report = list(executor.map(warm, questions))
+
+    warmed = sum(1 for item in report if not item["error"])
+    logger.info(f"Pre-warmed {warmed}/{len(report)} frequent questions")
+    return report
+
+
+def start_background_prewarm(agent, limit: int, concurrency: int) -> threading.Thread:
+    """Warm the cache without delaying startup"""
+    def run():
+        try:
+            prewarm_cache(agent, limit, concurrency)
+        except Exception as e:
+            logger.warning(f"Cache pre-warming failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name="querycraft-prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,298 @@
+import time
+import logging
+import datetime
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .answer_cache import pack_rows, unpack_rows
+from .models import SavedQuery
+from .sql_validator import parse_sql, split_top_level
+from .targets import get_target
+
+logger = logging.getLogger(__name__)
+
+# Orders are append-mostly and dated, so order_date is the watermark for incremental refresh
+WATERMARK_TABLE = "core_order"
+WATERMARK_COLUMN = "order_date"
+
+# Aggregates whose value over a union of row sets can be computed from the values over each set
+_MERGEABLE = frozenset(["COUNT", "SUM", "MIN", "MAX"])
+_UNSUPPORTED = frozenset(["UNION", "INTERSECT", "EXCEPT", "DISTINCT", "HAVING", "ORDER", "LIMIT", "OFFSET",
+                          "FETCH", "OVER", "WINDOW", "WITH", "LEFT", "RIGHT", "FULL", "AVG"])
+# Rolling windows ("last 30 days") move with the clock, so rows folded into the base result can age out of them
+_CLOCK_FUNCTIONS = frozenset(["CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP",
+                              "NOW", "STATEMENT_TIMESTAMP", "CLOCK_TIMESTAMP", "TRANSACTION_TIMESTAMP", "TIMEOFDAY",
+                              "AGE"])
+_CLOCK_LITERALS = frozenset(["'now'", "'today'", "'tomorrow'", "'yesterday'"])
+
+
+class IncrementalPlan(NamedTuple):
+    head: str                # statement up to where the date predicate goes
+    where_clause: str        # the query's own WHERE condition, if any
+    tail: str                # GROUP BY onwards
+    qualifier: str           # how the statement names core_order
+    aggregates: Dict         # select-list position -> COUNT/SUM/MIN/MAX
+
+    def windowed_sql(self, predicate: str) -> str:
+        """The statement restricted to predicate, with the statement's own % escaped for parameters"""
+        head, where, tail = (part.replace("%", "%%") for part in (self.head, self.where_clause, self.tail))
+        condition = f"({where}) AND {predicate}" if where else predicate
+        keyword = "" if where else " WHERE"
+        return f"{head}{keyword} {condition} {tail}".rstrip()
+
+
+def _same_expression(group_item, position: int, select_item) -> bool:
+    """Whether a GROUP BY item names select_item: by position, by output name or as the same expression"""
+    if len(group_item) == 1 and group_item[0].kind == "number":
+        return group_item[0].value == str(position + 1)
+
+    def text(tokens):
+        return [token.value.lower() if token.kind == "word" else token.value for token in tokens]
+
+    expression = select_item
+    if len(select_item) > 2 and select_item[-2].upper == "AS":
+        expression = select_item[:-2]
+    if text(group_item) == text(expression):
+        return True
+    names = {text(select_item[-1:])[0]} if select_item else set()
+    return len(group_item) == 1 and text(group_item)[0] in names
+
+
+def plan_incremental(sql_query: str) -> Optional[IncrementalPlan]:
+    """How to refresh sql_query from new orders only, or None when only a full refresh is correct
+
+    The statement must read core_order once (inner joins to other tables are
+    fine), select COUNT/SUM/MIN/MAX aggregates, optionally grouped by columns
+    it also selects, and not depend on the current date or time.
+    """
+    parsed = parse_sql(sql_query)
+    tokens = [token for token in parsed.tokens if token.value != ";"]
+    if parsed.statement_type != "SELECT" or parsed.statement_count != 1 or WATERMARK_TABLE not in parsed.tables:
+        return None
+    if {token.upper for token in tokens} & (_UNSUPPORTED | _CLOCK_FUNCTIONS):
+        return None
+    if any(token.kind == "string" and token.value.lower() in _CLOCK_LITERALS for token in tokens):
+        return None
+    if sum(1 for token in tokens if token.upper == "SELECT") > 1:
+        return None
+
+    aliases = [alias for alias, table in parsed.aliases.items() if table == WATERMARK_TABLE and alias != WATERMARK_TABLE]
+    if len(aliases) > 1:
+        return None
+    qualifier = aliases[0] if aliases else WATERMARK_TABLE
+
+    clauses, depth = {}, 0
+    for index, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.upper in ("FROM", "WHERE", "GROUP") and token.upper not in clauses:
+            clauses[token.upper] = index
+    if "FROM" not in clauses:
+        return None
+
+    aggregates, grouped = {}, []
+    for position, item in enumerate(split_top_level(tokens[1:clauses["FROM"]])):
+        head = item[0].upper if item else ""
+        if head in _MERGEABLE and len(item) > 2 and item[1].value == "(":
+            depth, close = 0, None
+            for index, token in enumerate(item[1:], 1):
+                depth += token.value == "("
+                depth -= token.value == ")"
+                if depth == 0:
+                    close = index
+                    break
+            rest = item[close + 1:]
+            if rest and rest[0].upper == "AS":
+                rest = rest[1:]
+            if len(rest) > 1:
+                return None
+            aggregates[position] = head
+        elif any(token.upper in _MERGEABLE for token in item):
+            # An expression over an aggregate (SUM(x) / COUNT(*)) can't be merged
+            return None
+        else:
+            grouped.append((position, item))
+    if not aggregates:
+        return None
+
+    if "GROUP" in clauses:
+        # Results are merged on their non-aggregate columns, so every group must be one of them
+        for group_item in split_top_level(tokens[clauses["GROUP"] + 2:]):
+            if not any(_same_expression(group_item, position, item) for position, item in grouped):
+                return None
+
+    end = tokens[-1].end
+    group_start = tokens[clauses["GROUP"]].start if "GROUP" in clauses else end
+    if "WHERE" in clauses:
+        where_token = tokens[clauses["WHERE"]]
+        head = sql_query[:where_token.end]
+        where_clause = sql_query[where_token.end:group_start].strip()
+    else:
+        head = sql_query[:group_start].rstrip()
+        where_clause = ""
+
+    return IncrementalPlan(head, where_clause, sql_query[group_start:end], qualifier, aggregates)
+
+
+def merge_results(base: List[Dict], delta: List[Dict], aggregates: Dict) -> List[Dict]:
+    """Combine two grouped results row by row; groups only one side has are kept as they are"""
+    rows = base or delta
+    if not rows:
+        return []
+    columns = list(rows[0])
+    functions = {columns[position]: function for position, function in aggregates.items() if position < len(columns)}
+    keys = [column for column in columns if column not in functions]
+
+    merged = {}
+    for row in list(base) + list(delta):
+        key = tuple(row.get(column) for column in keys)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = dict(row)
+            continue
+        for column, function in functions.items():
+            mine, theirs = current.get(column), row.get(column)
+            if mine is None or theirs is None:
+                current[column] = theirs if mine is None else mine
+            elif function in ("COUNT", "SUM"):
+                current[column] = mine + theirs
+            elif function == "MIN":
+                current[column] = min(mine, theirs)
+            else:
+                current[column] = max(mine, theirs)
+    return list(merged.values())
+
+
+def _run(cursor, sql_query: str, params=None) -> List[Dict]:
+    cursor.execute(sql_query, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def refresh_saved_query(saved: SavedQuery, full: bool = False) -> SavedQuery:
+    """Recompute saved's stored result, only from orders on or after the watermark when possible
+
+    Orders dated before the watermark are folded into base_result once; orders
+    on the latest date seen may still be arriving, so that open tail is
+    recomputed every time and merged on top. A periodic full refresh picks up
+    edits and deletions of older orders.
+    """
+    target = get_target(saved.target)
+    plan = plan_incremental(saved.sql_query) if target.is_default else None
+    now = timezone.now()
+    full_due = (saved.last_full_refresh_at is None
+                or now - saved.last_full_refresh_at >= datetime.timedelta(seconds=settings.QUERYCRAFT_SAVED_QUERY_FULL_REFRESH))
+    if plan is None or full or full_due or saved.base_result is None:
+        base, watermark = [], None
+        full = True
+    else:
+        base, watermark = unpack_rows(bytes(saved.base_result)), saved.watermark
+
+    start_time = time.time()
+    try:
+        with target.cursor() as cursor:
+            if plan is None:
+                result = _run(cursor, saved.sql_query)
+            else:
+                cursor.execute(f"SELECT MAX({WATERMARK_COLUMN}) FROM {WATERMARK_TABLE}")
+                cutoff = cursor.fetchone()[0]
+                if isinstance(cutoff, str):
+                    # Backends without date types (SQLite) return the ISO text
+                    cutoff = datetime.date.fromisoformat(cutoff[:10])
+                column = f"{plan.qualifier}.{WATERMARK_COLUMN}"
+
+                if cutoff is not None and (watermark is None or cutoff > watermark):
+                    if watermark is None:
+                        delta = _run(cursor, plan.windowed_sql(f"{column} < %s"), [cutoff])
+                    else:
+                        delta = _run(cursor, plan.windowed_sql(f"{column} >= %s AND {column} < %s"), [watermark, cutoff])
+                    base = merge_results(base, delta, plan.aggregates)
+                    watermark = cutoff
+
+                if watermark is None:
+                    # No dated orders yet: the whole answer is the open tail
+                    tail = _run(cursor, saved.sql_query)
+                else:
+                    tail = _run(cursor, plan.windowed_sql(f"{column} >= %s"), [watermark])
+                result = merge_results(base, tail, plan.aggregates)
+    except Exception as e:
+        logger.error(f"Refreshing saved query {saved.name} failed: {str(e)}")
+        saved.last_error = str(e)
+        saved.next_refresh_at = now + datetime.timedelta(seconds=saved.refresh_interval)
+        saved.save(update_fields=["last_error", "next_refresh_at"])
+        return saved
+
+    saved.refresh_strategy = SavedQuery.REFRESH_INCREMENTAL if plan else SavedQuery.REFRESH_FULL
+    saved.base_result = pack_rows(base) if plan else None
+    saved.watermark = watermark if plan else None
+    saved.result = pack_rows(result)
+    saved.row_count = len(result)
+    saved.refresh_time = round(time.time() - start_time, 3)
+    saved.last_error = None
+    saved.last_refreshed_at = now
+    if full:
+        saved.last_full_refresh_at = now
+    saved.next_refresh_at = now + datetime.timedelta(seconds=saved.refresh_interval)
+    saved.save()
+
+    logger.info(f"Refreshed saved query {saved.name} ({'full' if full else 'incremental'}) "
+                f"in {saved.refresh_time:.2f}s, {saved.row_count} rows")
+    return saved
+
+
+def seed_saved_query(saved: SavedQuery, rows: List[Dict], refresh_time: float = 0.0) -> SavedQuery:
+    """Store the rows the question was first answered with, so saving it doesn't run the SQL again
+
+    The incremental base isn't known yet; the first scheduled refresh is a full one.
+    """
+    now = timezone.now()
+    saved.result = pack_rows(rows)
+    saved.row_count = len(rows)
+    saved.refresh_time = round(refresh_time or 0.0, 3)
+    saved.last_error = None
+    saved.last_refreshed_at = now
+    saved.next_refresh_at = now + datetime.timedelta(seconds=saved.refresh_interval)
+    saved.save()
+    return saved
+
+
+def saved_result(saved: SavedQuery) -> List[Dict]:
+    return unpack_rows(bytes(saved.result)) if saved.result is not None else []
+
+
+def refresh_due_queries(full: bool = False) -> List[SavedQuery]:
+    """Refresh every saved query whose time has come; each is claimed first so concurrent runners don't both run it"""
+    now = timezone.now()
+    refreshed = []
+    due = SavedQuery.objects.filter(Q(next_refresh_at__isnull=True) | Q(next_refresh_at__lte=now)).order_by("next_refresh_at")
+    for saved in due:
+        claimed = SavedQuery.objects.filter(pk=saved.pk, next_refresh_at=saved.next_refresh_at).update(
+            next_refresh_at=now + datetime.timedelta(seconds=saved.refresh_interval)
+        )
+        if not claimed:
+            continue
+        refreshed.append(refresh_saved_query(saved, full=full))
+    return refreshed
+
+
+def start_saved_query_scheduler(interval: int) -> threading.Thread:
+    """Refresh due saved queries every interval seconds for the life of the process"""
+    def run():
+        while True:
+            try:
+                refresh_due_queries()
+            except Exception as e:
+                logger.warning(f"Saved query refresh failed: {str(e)}")
+            finally:
+                connections.close_all()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="querycraft-saved-queries", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+from typing import Dict, List
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Base tables exposed to the model, in prompt order
+CORE_TABLES: Dict[str, List[str]] = {
+    "core_customer": ["id", "name", "email", "registration_date"],
+    "core_product": ["id", "name", "category", "price"],
+    "core_order": ["id", "customer_id", "product_id", "order_date", "quantity", "status"],
+}
+
+# Materialized rollups created by migration 0002 (PostgreSQL only)
+ROLLUP_TABLES: Dict[str, List[str]] = {
+    "core_daily_order_rollup": ["order_date", "product_id", "status", "order_count", "total_quantity", "revenue"],
+    "core_category_revenue_rollup": ["order_date", "category", "status", "order_count", "total_quantity", "revenue"],
+}
+
+ROLLUP_HINTS = [
+    '"orders per day", "orders per product" or "orders by status" counts can use SUM(order_count) from core_daily_order_rollup',
+    '"revenue" or "sales" per category can use SUM(revenue) from core_category_revenue_rollup',
+    "Rollups are refreshed periodically; use the base tables when the question asks about individual orders or customers",
+]
+
+_rollups_available = None
+
+
+def rollups_available() -> bool:
+    """Check once whether the materialized rollups exist and are enabled"""
+    global _rollups_available
+
+    if not getattr(settings, "QUERYCRAFT_USE_ROLLUPS", True) or connection.vendor != "postgresql":
+        return False
+
+    if _rollups_available is None:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM pg_matviews WHERE matviewname = ANY(%s) AND ispopulated",
+                    [list(ROLLUP_TABLES)]
+                )
+                _rollups_available = cursor.fetchone()[0] == len(ROLLUP_TABLES)
+        except Exception as e:
+            logger.warning(f"Could not check for rollup views: {str(e)}")
+            return False
+
+    return _rollups_available
+
+
+def get_tables(include_rollups: bool = True) -> Dict[str, List[str]]:
+    """Return the queryable tables and their columns"""
+    tables = dict(CORE_TABLES)
+    if include_rollups and rollups_available():
+        tables.update(ROLLUP_TABLES)
+    return tables
+
+
+def describe_schema() -> str:
+    """Render the schema section of the generation prompt"""
+    lines = [f"- {table} ({', '.join(columns)})" for table, columns in CORE_TABLES.items()]
+
+    if rollups_available():
+        lines.append("")
+        lines.append("Pre-aggregated rollups (prefer these for aggregate questions):")
+        lines.extend(f"- {table} ({', '.join(columns)})" for table, columns in ROLLUP_TABLES.items())
+        lines.extend(f"- {hint}" for hint in ROLLUP_HINTS)
+
+    return "\n        ".join(lines)
+
+
+def refresh_rollups(concurrently: bool = True) -> List[str]:
+    """Refresh every rollup view and return the names that were refreshed"""
+    global _rollups_available
+
+    if connection.vendor != "postgresql":
+        return []
+
+    refreshed = []
+    with connection.cursor() as cursor:
+        for table in ROLLUP_TABLES:
+            # CONCURRENTLY keeps the view readable but needs it populated at least once
+            cursor.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                logger.warning(f"Rollup {table} does not exist, run migrations first")
+                continue
+
+            mode = "CONCURRENTLY " if concurrently and row[0] else ""
+            cursor.execute(f"REFRESH MATERIALIZED VIEW {mode}{table}")
+            refreshed.append(table)
+
+    _rollups_available = len(refreshed) == len(ROLLUP_TABLES)
+    return refreshed
+
+
+_schema_fingerprint = None
+
+
+def schema_fingerprint() -> str:
+    """Short hash of the applied migrations, so cached answers die with the schema they were made for"""
+    global _schema_fingerprint
+
+    if _schema_fingerprint is None:
+        digest = hashlib.sha1()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT app, name FROM django_migrations ORDER BY id")
+                for app, name in cursor.fetchall():
+                    digest.update(f"{app}.{name};".encode())
+        except Exception as e:
+            # Not cached, so the next call tries again once the database is reachable
+            logger.warning(f"Could not read applied migrations: {str(e)}")
+            return "unknown"
+        digest.update(",".join(get_tables()).encode())
+        _schema_fingerprint = digest.hexdigest()[:12]
+
+    return _schema_fingerprint
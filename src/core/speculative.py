@@ -0,0 +1,121 @@
+import json
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from django.db import connections
+
+from .llm import GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+
+def explain_cost(target, sql_query: str) -> float:
+    """Planner cost of sql_query on target; raises if the database cannot plan it
+
+    PostgreSQL reports the plan's total cost. SQLite has no costs, so each full
+    table scan in the query plan counts as one unit and index searches are free.
+    """
+    with target.cursor() as cursor:
+        if target.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql_query}")
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return float(plan[0]["Plan"]["Total Cost"])
+
+        if target.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql_query}")
+            return float(sum(1 for row in cursor.fetchall() if str(row[-1]).startswith("SCAN")))
+
+        cursor.execute(f"EXPLAIN {sql_query}")
+        cursor.fetchall()
+        return 0.0
+
+
+class SpeculativeGenerator:
+    """Runs several generations of one prompt in parallel and keeps the best candidate that checks out
+
+    The first valid candidate opens a short grace window; whatever else turns
+    valid inside it competes on cost, and everything still generating is cancelled.
+    """
+
+    def __init__(self, llm, temperatures: List[float], grace: float = 0.5):
+        self.llm = llm
+        self.temperatures = temperatures
+        self.grace = grace
+
+    def run(self, prompt: str, options: Dict, count: int,
+            check: Callable[[str], Tuple[str, Optional[str], Optional[float]]],
+            on_candidate: Optional[Callable[[Dict], None]] = None) -> Tuple[Optional[Dict], List[Dict]]:
+        """Return (best valid candidate or None, every finished candidate)
+
+        check(raw_response) returns (sql_query, error, cost); a candidate is valid
+        when error is None.
+        """
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=count, thread_name_prefix="querycraft-candidate")
+        futures = [
+            executor.submit(self._candidate, index, prompt, options, check, cancel_event)
+            for index in range(count)
+        ]
+
+        finished = []
+        deadline = None
+        pending = set(futures)
+        try:
+            while pending:
+                timeout = None if deadline is None else max(deadline - time.time(), 0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for future in done:
+                    candidate = future.result()
+                    if candidate is None:
+                        continue
+                    finished.append(candidate)
+                    if on_candidate:
+                        on_candidate(candidate)
+                    if candidate["valid"] and deadline is None:
+                        deadline = time.time() + self.grace
+        finally:
+            # Losers stop at their next streamed token; nobody waits for them
+            cancel_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        valid = [candidate for candidate in finished if candidate["valid"]]
+        best = min(valid, key=lambda candidate: (candidate["cost"], candidate["finished_at"])) if valid else None
+        return best, finished
+
+    def _candidate(self, index: int, prompt: str, options: Dict, check, cancel_event) -> Optional[Dict]:
+        temperature = self.temperatures[index % len(self.temperatures)]
+        candidate = {
+            "index": index,
+            "temperature": temperature,
+            "sql_query": None,
+            "valid": False,
+            "cost": None,
+            "error": None,
+            "tokens_used": 0,
+            "response_data": None,
+        }
+        start_time = time.time()
+        try:
+            response_data = self.llm.generate(prompt, dict(options, temperature=temperature), cancel_event=cancel_event)
+            candidate["response_data"] = response_data
+            candidate["tokens_used"] = response_data.get("eval_count", 0)
+            candidate["sql_query"], candidate["error"], candidate["cost"] = check(response_data.get("response", "").strip())
+            candidate["valid"] = candidate["error"] is None
+        except GenerationCancelled:
+            return None
+        except Exception as e:
+            candidate["error"] = str(e)
+        finally:
+            # Each candidate thread opened its own connection for EXPLAIN
+            connections.close_all()
+
+        candidate["generation_time"] = round(time.time() - start_time, 3)
+        candidate["finished_at"] = time.time()
+        return candidate
@@ -0,0 +1,131 @@
+import re
+from typing import Optional
+
+# Compiled once at import; every pattern below is applied in a single left-to-right pass
+_FENCE_RE = re.compile(r"```[^\S\n]*(?:sql|postgresql|postgres|pgsql)?[^\S\n]*\n?(.*?)(?:```|\Z)", re.IGNORECASE | re.DOTALL)
+
+# A WITH only counts when it opens a CTE, so prose like "with the highest price" is skipped
+_START_UPPER_RE = re.compile(r"\bSELECT\b|\bWITH\s+(?:RECURSIVE\s+)?\w+\s*(?:\([^()]*\)\s*)?AS\s*\(")
+_START_ANY_RE = re.compile(_START_UPPER_RE.pattern, re.IGNORECASE)
+
+# Once inside the statement: literals and comments are skipped whole, so ';' or '```' inside them is ignored
+_SCAN_RE = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<literal>'(?:[^']+|'')*(?:'|\Z)|"(?:[^"]+|"")*(?:"|\Z))
+  | (?P<semi>;)
+  | (?P<fence>```)
+  | (?P<blank>\n[^\S\n]*\n)
+  | (?P<open>\()
+  | (?P<close>\))
+""", re.VERBOSE | re.DOTALL)
+
+# After a blank line the statement goes on only if the next line reads as more of it, in the
+# keyword case the statement itself uses ("In this query..." is prose)...
+_CONTINUATION_KEYWORDS = (r"(?:FROM|WHERE|GROUP|ORDER|HAVING|LIMIT|OFFSET|FETCH|WINDOW|UNION|INTERSECT|EXCEPT|JOIN|"
+                          r"INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|ON|USING|AND|OR|NOT|AS|WHEN|THEN|ELSE|END|OVER|"
+                          r"PARTITION|BETWEEN|IN|IS|LIKE|ILIKE)\b")
+_CONTINUATION_UPPER_RE = re.compile(_CONTINUATION_KEYWORDS + r"|[,=<>]|\|\||--")
+_CONTINUATION_LOWER_RE = re.compile(_CONTINUATION_KEYWORDS.lower() + r"|[,=<>]|\|\||--")
+# ...or the text before it can't end a statement
+_UNFINISHED_RE = re.compile(
+    r"(?:[,(+\-*/%=<>|]|\b(?:SELECT|DISTINCT|FROM|WHERE|GROUP|ORDER|BY|HAVING|JOIN|ON|AND|OR|NOT|AS|IN|IS|"
+    r"UNION|INTERSECT|EXCEPT|ALL|BETWEEN|LIKE|ILIKE|CASE|WHEN|THEN|ELSE|OVER|PARTITION|WITH))\s*\Z",
+    re.IGNORECASE
+)
+
+_FALLBACK_CLEAN_RE = re.compile(r"[^a-zA-Z0-9\s_,.*=()'\-+]")
+_FALLBACK_WORDS = ("SELECT", "FROM", "WHERE")
+
+
+def _find_start(text: str) -> Optional[int]:
+    # Prefer upper-case keywords: models write SQL in caps and prose in lower case
+    match = _START_UPPER_RE.search(text) or _START_ANY_RE.search(text)
+    return match.start() if match else None
+
+
+def _continues(text: str, position: int, before: str) -> bool:
+    """Whether the statement scanned so far (before) goes on past the blank line ending at position"""
+    following = text[position:].lstrip()
+    if not following or following.startswith("```"):
+        return False
+    continuation = _CONTINUATION_UPPER_RE if before[:1].isupper() else _CONTINUATION_LOWER_RE
+    return bool(_UNFINISHED_RE.search(before) or continuation.match(following))
+
+
+def _scan_statement(text: str, start: int) -> str:
+    """Collect one statement from start, dropping comments, up to its terminator"""
+    parts = []
+    position = start
+    depth = 0
+
+    for match in _SCAN_RE.finditer(text, start):
+        kind = match.lastgroup
+        if kind == "open":
+            depth += 1
+            continue
+        if kind == "close":
+            depth = max(depth - 1, 0)
+            continue
+        if kind == "literal":
+            continue
+        if kind == "blank" and (depth > 0 or _continues(text, match.end(), "".join(parts) + text[position:match.start()])):
+            continue
+
+        parts.append(text[position:match.start()])
+        position = match.end()
+
+        if kind == "comment":
+            parts.append(" ")
+            continue
+        if kind == "semi":
+            parts.append(";")
+        # semi, fence, or a blank line followed by something other than SQL ends the statement
+        return "".join(parts).strip()
+
+    parts.append(text[position:])
+    return "".join(parts).strip()
+
+
+def find_sql(text: str) -> Optional[str]:
+    """Return the first SQL statement in a model response, or None
+
+    Code fences are honoured when present; otherwise the statement runs from the
+    first SELECT/WITH to a semicolon, a closing fence, or a blank line that
+    isn't followed by more of the statement.
+    """
+    if not text:
+        return None
+
+    candidates = []
+    if "```" in text:
+        candidates.extend(match.group(1) for match in _FENCE_RE.finditer(text))
+    candidates.append(text.replace("```", "\n\n"))
+
+    for candidate in candidates:
+        start = _find_start(candidate)
+        if start is None:
+            continue
+
+        query = _scan_statement(candidate, start)
+        if query:
+            if not query.endswith(";"):
+                query += ";"
+            return query
+
+    return None
+
+
+def extract_sql_query(text: str) -> Optional[str]:
+    """Extract SQL from model output, falling back to a cleaned-up version of the text"""
+    query = find_sql(text)
+    if query is not None:
+        return query
+
+    # If no SQL statement found, try to clean up and return the whole text
+    cleaned_text = _FALLBACK_CLEAN_RE.sub(" ", text.replace("```", " ")).strip()
+    if cleaned_text and any(word in cleaned_text.upper() for word in _FALLBACK_WORDS):
+        if not cleaned_text.endswith(";"):
+            cleaned_text += ";"
+        return cleaned_text
+
+    return None
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+from .sql_validator import parse_sql
+
+logger = logging.getLogger(__name__)
+
+# A literal right after one of these is a value the question chose, not part of the query's shape
+_COMPARISON_OPERATORS = frozenset(["=", "<>", "!=", "<", ">", "<=", ">="])
+_LIFT_AFTER_KEYWORDS = frozenset(["LIKE", "ILIKE", "LIMIT", "OFFSET"])
+
+# Only filter clauses are lifted: a parameter in the select list or GROUP BY would make
+# otherwise identical expressions differ ($1 vs $2) and break grouping
+_CLAUSE_STARTS = frozenset(["SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET",
+                            "ON", "WINDOW", "FETCH", "UNION", "INTERSECT", "EXCEPT"])
+_LIFT_CLAUSES = frozenset(["WHERE", "HAVING", "ON", "LIMIT", "OFFSET"])
+
+
+class ParameterizedSQL(NamedTuple):
+    sql: str                 # executable with %s placeholders (literal % escaped) when params exist
+    numbered: str            # same statement with $1..$n placeholders, for PREPARE
+    shape: str               # whitespace- and comment-insensitive form with ? for each lifted literal
+    params: Tuple
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.shape}\x00{self.params!r}"
+
+
+def _literal_value(token):
+    if token.kind == "number":
+        text = token.value
+        return int(text) if text.isdigit() else float(text)
+    return token.value[1:-1].replace("''", "'")
+
+
+@lru_cache(maxsize=1024)
+def parameterize_sql(sql: str) -> ParameterizedSQL:
+    """Lift comparison, LIKE and LIMIT/OFFSET literals out of sql
+
+    Typed literals (INTERVAL '1 month', DATE '...'), casts and positional
+    ORDER BY / GROUP BY numbers stay inline because they change the plan or
+    the meaning of the statement, not just a value.
+    """
+    tokens = list(parse_sql(sql).tokens)
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+
+    # Statements that already carry placeholders are left exactly as they are
+    if not tokens or any(token.kind == "param" for token in tokens):
+        text = sql.strip().rstrip(";").strip()
+        return ParameterizedSQL(text, text, " ".join(token.value for token in tokens), ())
+
+    lifted = []
+    clauses = [None]
+    for index, token in enumerate(tokens):
+        if token.value == "(":
+            clauses.append(clauses[-1])
+            continue
+        if token.value == ")":
+            if len(clauses) > 1:
+                clauses.pop()
+            continue
+        if token.upper in _CLAUSE_STARTS:
+            clauses[-1] = token.upper
+            continue
+
+        if token.kind not in ("number", "string") or token.value[:1] not in "'0123456789." or index == 0:
+            continue
+        if clauses[-1] not in _LIFT_CLAUSES:
+            continue
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if following is not None and following.kind == "cast":
+            continue
+        previous = tokens[index - 1]
+        if previous.value in _COMPARISON_OPERATORS or previous.upper in _LIFT_AFTER_KEYWORDS:
+            lifted.append(index)
+
+    start = tokens[0].start
+    end = tokens[-1].end
+    if not lifted:
+        text = sql[start:end]
+        return ParameterizedSQL(text, text, " ".join(token.value for token in tokens), ())
+
+    lifted_set = set(lifted)
+    sql_parts, numbered_parts = [], []
+    position = start
+    for number, index in enumerate(lifted, 1):
+        token = tokens[index]
+        between = sql[position:token.start]
+        sql_parts.append(between.replace("%", "%%") + "%s")
+        numbered_parts.append(f"{between}${number}")
+        position = token.end
+    sql_parts.append(sql[position:end].replace("%", "%%"))
+    numbered_parts.append(sql[position:end])
+
+    shape = " ".join("?" if index in lifted_set else token.value for index, token in enumerate(tokens))
+    params = tuple(_literal_value(tokens[index]) for index in lifted)
+    return ParameterizedSQL("".join(sql_parts), "".join(numbered_parts), shape, params)
+
+
+# Prepared statements live in the server session, so they are tracked per raw DB-API connection;
+# a reconnect gets a fresh entry and the old one disappears with the dead connection
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+class _SessionStatements:
+    def __init__(self):
+        self.names = OrderedDict()
+        self.counter = 0
+
+
+def execute_parameterized(cursor, connection, query: ParameterizedSQL, max_statements: int = 100):
+    """Run query on cursor, through a reused server-side prepared statement on PostgreSQL
+
+    Only persistent connections (CONN_MAX_AGE other than 0) prepare: a connection
+    closed after the request would pay the extra PREPARE round-trip and never
+    reuse the plan.
+    """
+    persistent = connection.settings_dict.get("CONN_MAX_AGE", 0) != 0
+    if connection.vendor != "postgresql" or max_statements <= 0 or not persistent:
+        cursor.execute(query.sql, query.params or None)
+        return
+
+    connection.ensure_connection()
+    try:
+        with _prepared_lock:
+            session = _prepared.setdefault(connection.connection, _SessionStatements())
+    except TypeError:
+        # Driver connection without weakref support; plain execution still benefits from the shape cache
+        cursor.execute(query.sql, query.params or None)
+        return
+
+    name = session.names.get(query.shape)
+    if name is None:
+        session.counter += 1
+        # Names are never reused, so a statement we lost track of can't collide with a new one
+        name = f"qc_{session.counter}_{hashlib.sha1(query.shape.encode()).hexdigest()[:8]}"
+        cursor.execute(f"PREPARE {name} AS {query.numbered}")
+        session.names[query.shape] = name
+
+        if len(session.names) > max_statements:
+            _, oldest = session.names.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {oldest}")
+    else:
+        session.names.move_to_end(query.shape)
+
+    arguments = f" ({', '.join(['%s'] * len(query.params))})" if query.params else ""
+    try:
+        cursor.execute(f"EXECUTE {name}{arguments}", query.params or None)
+    except Exception:
+        # The plan may be stale (schema change) or gone (pooler reset); prepare afresh next time
+        session.names.pop(query.shape, None)
+        raise
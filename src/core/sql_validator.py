@@ -0,0 +1,401 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple, Dict, List, FrozenSet
+
+# One pass over the text; alternatives are ordered so comments and literals win over operators
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^']+|'')*'?)
+  | (?P<dollar>\$(?P<tag>(?:[^\W\d]\w*)?)\$.*?(?:\$(?P=tag)\$|\Z))
+  | (?P<qident>"(?:[^"]+|"")*"?)
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<param>\$\d+|%s|%\(\w+\)s|\?)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<cast>::)
+  | (?P<op><>|!=|<=|>=|\|\||[-+*/%<>=~!^&|#@])
+  | (?P<punct>[(),;.\[\]])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Words that are never treated as table or column names
+KEYWORDS = frozenset("""
+    ALL AND ANY AS ASC ASYMMETRIC AT BETWEEN BIGINT BOOLEAN BOTH BY CASE CAST CHAR CHARACTER COLLATE CROSS
+    CUBE CURRENT CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP DATE DAY DECADE DECIMAL DESC DISTINCT DOUBLE DOW
+    DOY ELSE END EPOCH ESCAPE EXCEPT EXCLUDE EXISTS FALSE FETCH FILTER FIRST FLOAT FOLLOWING FOR FROM FULL
+    GROUP GROUPING GROUPS HAVING HOUR ILIKE IN INNER INT INTEGER INTERSECT INTERVAL IS ISODOW ISNULL JOIN
+    LAST LATERAL LEADING LEFT LIKE LIMIT LOCALTIME LOCALTIMESTAMP MATERIALIZED MICROSECONDS MILLISECONDS
+    MINUTE MONTH NATURAL NEXT NOT NOTNULL NULL NULLS NUMERIC OF OFFSET ON ONLY OR ORDER OTHERS OUTER OVER
+    OVERLAPS PARTITION PRECEDING PRECISION QUARTER RANGE REAL RECURSIVE REPEATABLE RIGHT ROLLUP ROW ROWS
+    SECOND SELECT SETS SIMILAR SMALLINT SOME SYMMETRIC SYSTEM TABLESAMPLE TEXT THEN TIES TIME TIMESTAMP TO
+    TRAILING TRUE UNBOUNDED UNION UNKNOWN USING VALUES VARCHAR VARYING WEEK WHEN WHERE WINDOW WITH WITHIN
+    WITHOUT YEAR ZONE BERNOULLI
+""".split())
+
+# Statements and clauses that can write, lock, or change session state
+FORBIDDEN_KEYWORDS = frozenset("""
+    INSERT UPDATE DELETE MERGE UPSERT DROP ALTER CREATE TRUNCATE GRANT REVOKE COPY EXEC EXECUTE CALL DO
+    VACUUM REINDEX CLUSTER REFRESH LOCK SHARE INTO SET RESET PREPARE DEALLOCATE DISCARD LISTEN NOTIFY
+    COMMENT ATTACH DETACH PRAGMA
+""".split())
+
+# Functions that touch the filesystem, other sessions, or sleep
+FORBIDDEN_FUNCTIONS = frozenset("""
+    PG_SLEEP PG_SLEEP_FOR PG_SLEEP_UNTIL PG_READ_FILE PG_READ_BINARY_FILE PG_LS_DIR PG_STAT_FILE
+    PG_TERMINATE_BACKEND PG_CANCEL_BACKEND PG_RELOAD_CONF PG_ROTATE_LOGFILE LO_IMPORT LO_EXPORT DBLINK
+    DBLINK_EXEC SET_CONFIG PG_ADVISORY_LOCK PG_ADVISORY_XACT_LOCK QUERY_TO_XML LOAD_EXTENSION
+""".split())
+
+# Keywords that end a FROM list
+_CLAUSE_KEYWORDS = frozenset([
+    "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "FETCH", "WINDOW",
+    "UNION", "INTERSECT", "EXCEPT", "ON", "USING",
+])
+
+_IDENTIFIER_KINDS = ("word", "qident")
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper() if self.kind == "word" else ""
+
+    @property
+    def name(self) -> str:
+        """Identifier as PostgreSQL resolves it: unquoted folds to lower case"""
+        if self.kind == "qident":
+            return self.value[1:-1].replace('""', '"')
+        return self.value.lower()
+
+
+class ParsedSQL(NamedTuple):
+    tokens: Tuple[Token, ...]
+    statement_count: int
+    statement_type: str
+    tables: FrozenSet[str]
+    ctes: FrozenSet[str]
+    aliases: Dict[str, Optional[str]]
+    columns: Tuple[Tuple[Optional[str], str], ...]
+    output_aliases: FrozenSet[str]
+    functions: FrozenSet[str]
+    keywords: FrozenSet[str]
+    error: Optional[str]
+
+
+class SQLValidationError(ValueError):
+    """Raised when generated SQL is not a safe, single read-only query"""
+
+
+def tokenize_sql(sql: str) -> Tuple[List[Token], Optional[str]]:
+    """Split SQL into significant tokens, dropping whitespace and comments"""
+    tokens = []
+    error = None
+
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            if kind == "comment" and match.group().startswith("/*") and not match.group().endswith("*/"):
+                error = "Unterminated comment"
+            continue
+
+        value = match.group()
+        if kind == "string" and (len(value) < 2 or not value.endswith("'")):
+            error = "Unterminated string literal"
+        elif kind == "qident" and (len(value) < 2 or not value.endswith('"')):
+            error = "Unterminated quoted identifier"
+        elif kind == "dollar":
+            kind = "string"
+
+        tokens.append(Token(kind, value, match.start(), match.end()))
+
+    return tokens, error
+
+
+@lru_cache(maxsize=1024)
+def parse_sql(sql: str) -> ParsedSQL:
+    """Parse SQL into the structure the validator needs; cached per SQL string"""
+    tokens, error = tokenize_sql(sql)
+
+    # Statement boundaries are top-level semicolons; trailing ones are harmless
+    statement_count = 0
+    has_content = False
+    for token in tokens:
+        if token.value == ";":
+            if has_content:
+                statement_count += 1
+            has_content = False
+        else:
+            has_content = True
+    if has_content:
+        statement_count += 1
+
+    significant = [t for t in tokens if t.value != ";"] if statement_count <= 1 else tokens
+    first = next((t for t in significant if t.value != "("), None)
+    statement_type = first.upper if first is not None and first.kind == "word" else ""
+
+    tables = set()
+    ctes = set()
+    aliases: Dict[str, Optional[str]] = {}
+    columns = []
+    output_aliases = set()
+    functions = set()
+    keywords = set()
+
+    # One frame per parenthesis level: whether it is a query scope and which clause it is in
+    stack = [{"query": True, "clause": None, "derived": False}]
+    expect_table = False
+    expect_alias_for: Optional[str] = None
+    expect_alias = False
+    in_cte_columns = False
+
+    count = len(significant)
+    i = 0
+    while i < count:
+        token = significant[i]
+        prev = significant[i - 1] if i > 0 else None
+        nxt = significant[i + 1] if i + 1 < count else None
+        frame = stack[-1]
+
+        if token.value == "(":
+            is_query = nxt is not None and nxt.upper in ("SELECT", "WITH")
+            stack.append({"query": is_query, "clause": None, "derived": expect_table})
+            expect_table = False
+            expect_alias = False
+            i += 1
+            continue
+
+        if token.value == ")":
+            closed = stack.pop() if len(stack) > 1 else frame
+            in_cte_columns = False
+            expect_alias = closed["derived"]
+            expect_alias_for = None
+            i += 1
+            continue
+
+        if token.kind == "cast":
+            # Skip the type name after ::
+            i += 2
+            continue
+
+        if token.value == ",":
+            expect_alias = False
+            if frame["query"] and frame["clause"] == "FROM":
+                expect_table = True
+            i += 1
+            continue
+
+        if token.kind not in _IDENTIFIER_KINDS:
+            expect_alias = False
+            i += 1
+            continue
+
+        upper = token.upper
+        if upper:
+            keywords.add(upper)
+
+        # Alias after a table or derived table: "core_order o" / "core_order AS o" / "(...) AS t"
+        if expect_alias:
+            expect_alias = False
+            if upper == "AS" and nxt is not None and nxt.kind in _IDENTIFIER_KINDS:
+                aliases[nxt.name] = expect_alias_for
+                i += 2
+                continue
+            if token.kind == "qident" or (upper not in KEYWORDS and upper not in FORBIDDEN_KEYWORDS):
+                aliases[token.name] = expect_alias_for
+                i += 1
+                continue
+
+        if expect_table:
+            if upper in ("LATERAL", "ONLY"):
+                i += 1
+                continue
+            expect_table = False
+            if nxt is not None and nxt.value == "(":
+                # Set-returning function such as generate_series(...)
+                functions.add(token.value.upper())
+                i += 1
+                continue
+
+            name = token.name
+            if nxt is not None and nxt.value == "." and i + 2 < count:
+                schema = name
+                name = significant[i + 2].name
+                i += 2
+                if schema != "public":
+                    name = f"{schema}.{name}"
+            tables.add(name)
+            aliases.setdefault(name, name)
+            expect_alias = True
+            expect_alias_for = name
+            i += 1
+            continue
+
+        if in_cte_columns:
+            output_aliases.add(token.name)
+            i += 1
+            continue
+
+        if upper == "WITH" and frame["clause"] is None:
+            frame["clause"] = "WITH"
+            i += 1
+            continue
+
+        if frame["clause"] == "WITH" and upper not in ("RECURSIVE", "AS", "NOT", "MATERIALIZED", "SELECT"):
+            if nxt is not None and (nxt.upper == "AS" or nxt.value == "("):
+                ctes.add(token.name)
+                aliases[token.name] = None
+                in_cte_columns = nxt.value == "("
+                i += 1
+                continue
+
+        if upper == "SELECT":
+            frame["query"] = True
+            frame["clause"] = "SELECT"
+        elif upper == "FROM" and frame["query"] and frame["clause"] == "SELECT":
+            frame["clause"] = "FROM"
+            expect_table = True
+        elif upper == "JOIN" and frame["query"]:
+            frame["clause"] = "FROM"
+            expect_table = True
+        elif upper in _CLAUSE_KEYWORDS and frame["query"]:
+            frame["clause"] = None if upper in ("UNION", "INTERSECT", "EXCEPT") else upper
+        elif upper == "TABLESAMPLE":
+            # "core_order o TABLESAMPLE SYSTEM (10)" keeps the alias slot open for nothing
+            pass
+        elif upper == "AS":
+            if nxt is not None and nxt.kind in _IDENTIFIER_KINDS:
+                output_aliases.add(nxt.name)
+                i += 2
+                continue
+        elif nxt is not None and nxt.value == "(" and token.kind == "word" and upper not in KEYWORDS:
+            functions.add(upper)
+        elif nxt is not None and nxt.value == "." and i + 2 < count:
+            target = significant[i + 2]
+            columns.append((token.name, "*" if target.value == "*" else target.name))
+            i += 3
+            continue
+        elif token.kind == "qident" or upper not in KEYWORDS:
+            is_bare_alias = (
+                frame["clause"] == "SELECT"
+                and prev is not None
+                and (
+                    prev.kind in ("word", "qident", "number", "string") and prev.upper not in KEYWORDS
+                    or prev.value == ")"
+                    or prev.upper == "END"
+                )
+                and (nxt is None or nxt.value == "," or nxt.upper == "FROM")
+            )
+            if is_bare_alias:
+                output_aliases.add(token.name)
+            elif upper not in FORBIDDEN_KEYWORDS:
+                columns.append((None, token.name))
+
+        i += 1
+
+    if error is None and len(stack) > 1:
+        error = "Unbalanced parentheses"
+
+    return ParsedSQL(
+        tokens=tuple(tokens),
+        statement_count=statement_count,
+        statement_type=statement_type,
+        tables=frozenset(tables - ctes),
+        ctes=frozenset(ctes),
+        aliases=aliases,
+        columns=tuple(columns),
+        output_aliases=frozenset(output_aliases),
+        functions=frozenset(functions),
+        keywords=frozenset(keywords),
+        error=error,
+    )
+
+
+def split_top_level(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    """Split tokens on separator outside parentheses"""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if token.value == separator and depth == 0:
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def token_text(sql: str, tokens: List[Token]) -> str:
+    """Original text spanned by tokens, comments and spacing included"""
+    return sql[tokens[0].start:tokens[-1].end] if tokens else ""
+
+
+def validate_sql(sql: str, schema: Optional[Dict[str, List[str]]] = None) -> ParsedSQL:
+    """Ensure SQL is one read-only SELECT/WITH statement over the allowed schema
+
+    Raises SQLValidationError with a user-facing message, otherwise returns the
+    parsed statement so callers can reuse the referenced tables.
+    """
+    parsed = parse_sql(sql)
+
+    if parsed.error:
+        raise SQLValidationError(f"Generated query could not be parsed: {parsed.error}")
+
+    if parsed.statement_count == 0:
+        raise SQLValidationError("No SQL query generated")
+
+    if parsed.statement_count > 1:
+        raise SQLValidationError("Generated query contains multiple statements")
+
+    if parsed.statement_type not in ("SELECT", "WITH"):
+        raise SQLValidationError("Generated query is not a SELECT statement")
+
+    forbidden = parsed.keywords & FORBIDDEN_KEYWORDS
+    if forbidden:
+        raise SQLValidationError(
+            f"Generated query contains unauthorized SQL operations: {', '.join(sorted(forbidden))}"
+        )
+
+    forbidden = parsed.functions & FORBIDDEN_FUNCTIONS
+    if forbidden:
+        raise SQLValidationError(
+            f"Generated query calls unauthorized functions: {', '.join(sorted(forbidden)).lower()}"
+        )
+
+    if not parsed.tables:
+        raise SQLValidationError("Generated query missing FROM clause")
+
+    if schema is None:
+        return parsed
+
+    allowed = {table.lower(): {column.lower() for column in columns} for table, columns in schema.items()}
+
+    unknown_tables = parsed.tables - set(allowed)
+    if unknown_tables:
+        raise SQLValidationError(f"Generated query references unknown tables: {', '.join(sorted(unknown_tables))}")
+
+    known_columns = set().union(*(allowed[table] for table in parsed.tables))
+    known_names = known_columns | parsed.output_aliases | set(parsed.aliases) | parsed.ctes
+
+    for qualifier, column in parsed.columns:
+        if qualifier is None:
+            if column not in known_names:
+                raise SQLValidationError(f"Generated query references unknown column: {column}")
+            continue
+
+        if qualifier not in parsed.aliases:
+            raise SQLValidationError(f"Generated query references unknown table or alias: {qualifier}")
+
+        table = parsed.aliases[qualifier]
+        # Derived tables and CTEs expose whatever their own SELECT lists produce
+        if table is not None and column != "*" and column not in allowed[table]:
+            raise SQLValidationError(f"Generated query references unknown column: {qualifier}.{column}")
+
+    return parsed
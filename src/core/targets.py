@@ -0,0 +1,151 @@
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import schema_catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET = "default"
+
+
+class UnknownTarget(ValueError):
+    """Raised when a question names a target that is not configured"""
+
+
+class QueryTarget:
+    """One database the agent can answer questions against, with its own connection and limits"""
+
+    def __init__(self, name: str, alias: str, statement_timeout: float = 0, max_rows: int = 0,
+                 schema_ttl: int = 300, tables: Optional[List[str]] = None):
+        self.name = name
+        self.alias = alias
+        self.statement_timeout = statement_timeout
+        self.max_rows = max_rows
+        self.schema_ttl = schema_ttl
+        self.allowed_tables = set(tables) if tables else None
+        self._schema = None
+        self._schema_loaded_at = 0
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        # Django keeps one persistent connection per alias and thread (CONN_MAX_AGE), which is the pool
+        return connections[self.alias]
+
+    @property
+    def vendor(self) -> str:
+        return self.connection.vendor
+
+    @property
+    def dialect(self) -> str:
+        return "PostgreSQL" if self.vendor == "postgresql" else self.connection.display_name
+
+    @property
+    def is_default(self) -> bool:
+        return self.alias == "default"
+
+    def get_tables(self) -> Dict[str, List[str]]:
+        """Queryable tables and columns; the default database keeps the curated catalog"""
+        if self.is_default:
+            return schema_catalog.get_tables()
+
+        with self._lock:
+            if self._schema is None or time.time() - self._schema_loaded_at > self.schema_ttl:
+                self._schema = self.introspect()
+                self._schema_loaded_at = time.time()
+                digest = hashlib.sha1(repr(sorted(self._schema.items())).encode()).hexdigest()[:12]
+                if self._fingerprint and digest != self._fingerprint:
+                    logger.info(f"Schema of target {self.name} changed")
+                self._fingerprint = digest
+            return self._schema
+
+    def introspect(self) -> Dict[str, List[str]]:
+        connection = self.connection
+        tables = {}
+        with connection.cursor() as cursor:
+            for info in connection.introspection.get_table_list(cursor):
+                if self.allowed_tables is not None and info.name not in self.allowed_tables:
+                    continue
+                description = connection.introspection.get_table_description(cursor, info.name)
+                tables[info.name] = [column.name for column in description]
+        logger.info(f"Introspected {len(tables)} tables on target {self.name}")
+        return tables
+
+    def describe_schema(self) -> str:
+        if self.is_default:
+            return schema_catalog.describe_schema()
+        return "\n        ".join(f"- {table} ({', '.join(columns)})" for table, columns in self.get_tables().items())
+
+    def fingerprint(self) -> str:
+        """Changes whenever this target's schema does, so cached answers for it expire"""
+        if self.is_default:
+            return schema_catalog.schema_fingerprint()
+        self.get_tables()
+        return f"{self.name}:{self._fingerprint}"
+
+    @contextmanager
+    def cursor(self):
+        """Cursor with this target's statement timeout applied for the duration of the block"""
+        connection = self.connection
+        if not self.statement_timeout:
+            with connection.cursor() as cursor:
+                yield cursor
+            return
+
+        if self.vendor == "postgresql":
+            # SET LOCAL dies with the transaction, so the timeout never leaks into ORM writes
+            with transaction.atomic(using=self.alias), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [int(self.statement_timeout * 1000)])
+                yield cursor
+        elif self.vendor == "sqlite":
+            # sqlite3 aborts the running statement when the progress handler returns true
+            deadline = time.monotonic() + self.statement_timeout
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            try:
+                with connection.cursor() as cursor:
+                    yield cursor
+            finally:
+                connection.connection.set_progress_handler(None, 0)
+        else:
+            with connection.cursor() as cursor:
+                yield cursor
+
+
+_targets = None
+_targets_lock = threading.Lock()
+
+
+def get_targets() -> Dict[str, QueryTarget]:
+    """Build the target registry from settings.QUERYCRAFT_TARGETS once per process"""
+    global _targets
+
+    with _targets_lock:
+        if _targets is None:
+            _targets = {
+                name: QueryTarget(
+                    name,
+                    options.get("DATABASE", f"target_{name}"),
+                    statement_timeout=float(options.get("STATEMENT_TIMEOUT", 0)),
+                    max_rows=int(options.get("MAX_ROWS", 0)),
+                    schema_ttl=int(options.get("SCHEMA_TTL", 300)),
+                    tables=options.get("TABLES"),
+                )
+                for name, options in settings.QUERYCRAFT_TARGETS.items()
+            }
+    return _targets
+
+
+def get_target(name: Optional[str] = None) -> QueryTarget:
+    name = name or DEFAULT_TARGET
+    target = get_targets().get(name)
+    if target is None:
+        raise UnknownTarget(f"Unknown target '{name}'. Available targets: {', '.join(sorted(get_targets()))}")
+    return target
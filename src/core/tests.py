@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase
+
+from .approximate import plan_approximation, sample_sql
+from .saved_queries import merge_results, plan_incremental
+from .sql_extraction import find_sql
+
+
+class PlanApproximationTests(SimpleTestCase):
+    def test_positional_group_by_names_the_expression(self):
+        # The sample query inserts error-bound columns, which would shift GROUP BY 2
+        plan, _ = plan_approximation("SELECT AVG(quantity) AS avg_q, status FROM core_order GROUP BY 2")
+        self.assertEqual(plan.group_clause, "status")
+        self.assertTrue(sample_sql(plan, 1.0).endswith("GROUP BY status"))
+
+    def test_filtered_queries_sample_rows(self):
+        plan, _ = plan_approximation("SELECT COUNT(*) FROM core_order WHERE order_date >= '2024-01-01'")
+        self.assertIn("TABLESAMPLE BERNOULLI", sample_sql(plan, 1.0))
+        plan, _ = plan_approximation("SELECT status, COUNT(*) FROM core_order GROUP BY status")
+        self.assertIn("TABLESAMPLE SYSTEM", sample_sql(plan, 1.0))
+
+    def test_position_of_an_aggregate_runs_exactly(self):
+        plan, reason = plan_approximation("SELECT COUNT(*), status FROM core_order GROUP BY 1")
+        self.assertIsNone(plan)
+        self.assertIn("GROUP BY", reason)
+
+
+class PlanIncrementalTests(SimpleTestCase):
+    def test_grouped_by_selected_column(self):
+        plan = plan_incremental("SELECT status, COUNT(*) AS n FROM core_order GROUP BY status")
+        self.assertIsNotNone(plan)
+        self.assertEqual(plan.aggregates, {1: "COUNT"})
+
+    def test_grouped_by_position(self):
+        self.assertIsNotNone(plan_incremental("SELECT COUNT(*) AS n, status FROM core_order GROUP BY 2"))
+
+    def test_group_not_selected_runs_in_full(self):
+        # Rows would be merged on no key at all, collapsing every group into one
+        self.assertIsNone(plan_incremental("SELECT COUNT(*) AS n FROM core_order GROUP BY status"))
+        self.assertIsNone(plan_incremental("SELECT COUNT(*) AS n, status FROM core_order GROUP BY 1"))
+        self.assertIsNone(plan_incremental("SELECT status, COUNT(*) FROM core_order GROUP BY status, customer_id"))
+
+    def test_rolling_window_runs_in_full(self):
+        self.assertIsNone(plan_incremental(
+            "SELECT COUNT(*) FROM core_order WHERE order_date >= CURRENT_DATE - INTERVAL '30 days'"
+        ))
+
+
+class MergeResultsTests(SimpleTestCase):
+    def test_merges_groups(self):
+        base = [{"status": "pending", "n": 2, "q": 5}]
+        delta = [{"status": "pending", "n": 1, "q": 7}, {"status": "completed", "n": 3, "q": 1}]
+        self.assertEqual(
+            merge_results(base, delta, {1: "COUNT", 2: "MAX"}),
+            [{"status": "pending", "n": 3, "q": 7}, {"status": "completed", "n": 3, "q": 1}]
+        )
+
+
+class FindSQLTests(SimpleTestCase):
+    def test_blank_line_inside_statement(self):
+        self.assertEqual(find_sql("SELECT a\n\nFROM t"), "SELECT a\n\nFROM t;")
+        self.assertEqual(find_sql("SELECT a,\n\n  b FROM t"), "SELECT a,\n\n  b FROM t;")
+
+    def test_blank_line_before_prose_ends_statement(self):
+        self.assertEqual(find_sql("SELECT a FROM t\n\nIn this query, a is listed."), "SELECT a FROM t;")
+        self.assertEqual(find_sql("SELECT a FROM t\n\n(Note: a is unique)"), "SELECT a FROM t;")
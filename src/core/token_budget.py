@@ -0,0 +1,113 @@
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+from .complexity import TOKEN_BUDGETS
+
+# Ollama rounds the KV cache to whole blocks anyway, so budgets move in these steps
+CTX_STEP = 256
+PREDICT_STEP = 64
+
+
+def _round_up(value: float, step: int) -> int:
+    return int(math.ceil(value / step) * step)
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)
+    return ordered[max(index, 0)]
+
+
+class AdaptiveTokenBudget:
+    """Learns the smallest safe num_ctx/num_predict per complexity tier from Ollama's token counts"""
+
+    def __init__(self, window=200, min_samples=10, headroom=1.25, percentile=0.95,
+                 min_ctx=1024, max_ctx=8192, min_predict=128, max_predict=1024):
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.percentile = percentile
+        self.min_ctx = min_ctx
+        self.max_ctx = max_ctx
+        self.min_predict = min_predict
+        self.max_predict = max_predict
+
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.counters = defaultdict(int)
+
+    def budget_for(self, complexity: str, prompt_chars: int, default: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Return the budget for a prompt, falling back to the static tier budget until enough history exists"""
+        default = dict(default or TOKEN_BUDGETS[complexity])
+
+        with self.lock:
+            samples = list(self.samples[complexity])
+
+        if len(samples) < self.min_samples:
+            return default
+
+        # Generation length: high percentile of what this tier actually produced, plus headroom
+        eval_counts = [eval_count for _, _, eval_count in samples]
+        num_predict = _round_up(_percentile(eval_counts, self.percentile) * self.headroom, PREDICT_STEP)
+        num_predict = min(max(num_predict, self.min_predict), self.max_predict)
+
+        # Prompt length: scale this prompt by the observed tokens-per-character ratio
+        ratios = [prompt_tokens / chars for chars, prompt_tokens, _ in samples if chars and prompt_tokens]
+        tokens_per_char = _percentile(ratios, self.percentile) if ratios else 0.5
+        prompt_tokens = prompt_chars * tokens_per_char * self.headroom
+
+        num_ctx = _round_up(prompt_tokens + num_predict, CTX_STEP)
+        num_ctx = min(max(num_ctx, self.min_ctx), self.max_ctx)
+
+        return {"num_ctx": num_ctx, "num_predict": num_predict}
+
+    def expand(self, budget: Dict[str, int]) -> Dict[str, int]:
+        """Budget for retrying a truncated generation"""
+        num_predict = min(budget["num_predict"] * 2, self.max_predict)
+        num_ctx = min(budget["num_ctx"] + num_predict - budget["num_predict"], self.max_ctx)
+        return {"num_ctx": num_ctx, "num_predict": num_predict}
+
+    def is_truncated(self, response_data: Dict, raw_response: str, budget: Dict[str, int]) -> bool:
+        """A generation is truncated when Ollama stopped on length before the statement terminator"""
+        if raw_response.rstrip().rstrip("`").rstrip().endswith(";"):
+            return False
+        if response_data.get("done_reason") == "length":
+            return True
+        return response_data.get("eval_count", 0) >= budget["num_predict"]
+
+    def record(self, complexity: str, prompt_chars: int, response_data: Dict, budget: Dict[str, int], truncated: bool):
+        """Record one generation; truncated runs are not used to learn the output length"""
+        prompt_tokens = response_data.get("prompt_eval_count", 0)
+        eval_count = response_data.get("eval_count", 0)
+        static = TOKEN_BUDGETS[complexity]
+
+        with self.lock:
+            if not truncated and eval_count:
+                self.samples[complexity].append((prompt_chars, prompt_tokens, eval_count))
+            self.counters["generations"] += 1
+            self.counters["truncations"] += int(truncated)
+            self.counters["num_ctx_reserved"] += budget["num_ctx"]
+            self.counters["num_ctx_static"] += static["num_ctx"]
+            self.counters["num_predict_reserved"] += budget["num_predict"]
+            self.counters["num_predict_static"] += static["num_predict"]
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            counters = dict(self.counters)
+            sample_counts = {complexity: len(samples) for complexity, samples in self.samples.items()}
+
+        generations = counters.get("generations", 0)
+        if not generations:
+            return {"generations": 0}
+
+        return {
+            "generations": generations,
+            "truncations": counters["truncations"],
+            "samples": sample_counts,
+            "num_ctx_saved": counters["num_ctx_static"] - counters["num_ctx_reserved"],
+            "num_predict_saved": counters["num_predict_static"] - counters["num_predict_reserved"],
+            "avg_num_ctx": round(counters["num_ctx_reserved"] / generations),
+            "avg_num_predict": round(counters["num_predict_reserved"] / generations),
+        }
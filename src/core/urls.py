@@ -1,10 +1,16 @@
 from django.urls import path
-from core.views import natural_language_query, test_db_connection, query_interface, query_history, query_stats
+from core.views import natural_language_query, test_db_connection, query_interface, query_history, query_stats, query_jobs, query_job_detail, query_stream, query_targets, saved_queries, saved_query_detail
 
 urlpatterns = [
     path('', query_interface, name='query_interface'),
     path('api/test-db/', test_db_connection, name='test_db_connection'),
     path('api/query/', natural_language_query, name='natural_language_query'),
+    path('api/query/stream/', query_stream, name='query_stream'),
     path('api/query/history/', query_history, name='query_history'),
     path('api/query/stats/', query_stats, name='query_stats'),
+    path('api/query/jobs/', query_jobs, name='query_jobs'),
+    path('api/query/jobs/<str:job_id>/', query_job_detail, name='query_job_detail'),
+    path('api/targets/', query_targets, name='query_targets'),
+    path('api/saved/', saved_queries, name='saved_queries'),
+    path('api/saved/<slug:name>/', saved_query_detail, name='saved_query_detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,235 @@
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from django.conf import settings
+
+from .targets import get_target
+
+logger = logging.getLogger(__name__)
+
+# Columns whose stored spelling the model can't know: names and low-cardinality labels
+INDEXED_COLUMNS = {
+    "core_product": ["name", "category"],
+    "core_customer": ["name"],
+}
+
+# Low-cardinality labels a question names with plain words ("books", "electronics")
+LABEL_COLUMNS = frozenset([("core_product", "category")])
+
+_WORD_RE = re.compile(r"[\w\u200c]+")
+_QUOTED_RE = re.compile(r"(?<!\w)[\"'\u201c\u2018\u00ab]([^\"'\u201d\u2019\u00bb]+)[\"'\u201d\u2019\u00bb](?!\w)")
+_SENTENCE_END_RE = re.compile(r"[.?!:;\n]\s*$")
+
+# Words every question uses; a product that happens to be called "Total" shouldn't match them
+_QUESTION_WORDS = frozenset("""
+    a all and any are as at average by count customer customers each for from give has have how in is
+    list many me most much number of on or order orders per price product products show sold spent
+    the their them top total what which who with
+""".split())
+
+
+def value_words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.casefold())
+
+
+def marked_words(question: str) -> Set[str]:
+    """Words the question sets apart as a name: quoted, or capitalized anywhere but a sentence start
+
+    Capitals say nothing in a Title Cased question, so they only count when
+    most longer words are lowercase.
+    """
+    marked = set()
+    for quoted in _QUOTED_RE.findall(question):
+        marked.update(value_words(quoted))
+
+    capitalized, longer = set(), 0
+    for match in _WORD_RE.finditer(question):
+        word = match.group()
+        before = question[:match.start()]
+        if not before.strip() or _SENTENCE_END_RE.search(before):
+            continue
+        longer += len(word) > 3
+        if word[0].isupper():
+            capitalized.add(word.casefold())
+    if len(capitalized) * 2 <= longer:
+        marked.update(capitalized)
+    return marked
+
+
+def max_distance(word: str) -> int:
+    """Typos tolerated for a word: none for short words or anything with digits ("prod1" is not "prod11")"""
+    if len(word) < 4 or any(char.isdigit() for char in word):
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+class _TrieNode:
+    __slots__ = ("children", "word")
+
+    def __init__(self):
+        self.children = {}
+        self.word = None
+
+
+class WordTrie:
+    """Words of the indexed values, searchable within an edit distance"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, word: str):
+        node = self.root
+        for char in word:
+            node = node.children.setdefault(char, _TrieNode())
+        node.word = word
+
+    def search(self, word: str, distance: int) -> List[Tuple[str, int]]:
+        """Indexed words within distance edits of word, with their distance
+
+        Walks the trie carrying one Levenshtein row per node, pruning
+        branches whose row has no cell within distance.
+        """
+        results = []
+        first_row = list(range(len(word) + 1))
+        stack = [(child, char, first_row) for char, child in self.root.children.items()]
+        while stack:
+            node, char, previous_row = stack.pop()
+            row = [previous_row[0] + 1]
+            for column in range(1, len(word) + 1):
+                row.append(min(row[column - 1] + 1, previous_row[column] + 1,
+                               previous_row[column - 1] + (word[column - 1] != char)))
+            if node.word is not None and row[-1] <= distance:
+                results.append((node.word, row[-1]))
+            if min(row) <= distance:
+                stack.extend((child, next_char, row) for next_char, child in node.children.items())
+        return results
+
+
+class ValueIndex:
+    """Distinct stored values of INDEXED_COLUMNS, for resolving mentions in a question to exact literals
+
+    New rows are picked up incrementally by id; a periodic full rebuild drops
+    values that were renamed or deleted.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self._reset()
+        self.refreshed_at = 0.0
+        self.rebuilt_at = 0.0
+
+    def _reset(self):
+        self.trie = WordTrie()
+        self.values: Dict[Tuple[str, str, str], Tuple[str, ...]] = {}
+        self.word_values: Dict[str, Set[Tuple[str, str, str]]] = defaultdict(set)
+        self.last_ids: Dict[str, int] = {}
+
+    def _add(self, table: str, column: str, value):
+        if not isinstance(value, str) or not value.strip():
+            return
+        key = (table, column, value)
+        if key in self.values:
+            return
+        words = tuple(value_words(value))
+        if not words:
+            return
+        self.values[key] = words
+        for word in words:
+            if word not in self.word_values:
+                self.trie.add(word)
+            self.word_values[word].add(key)
+
+    def refresh(self, full: bool = False):
+        """Load rows added since the last refresh, or everything when full"""
+        with self.lock:
+            if full:
+                self._reset()
+            added = 0
+            with get_target().cursor() as cursor:
+                for table, columns in INDEXED_COLUMNS.items():
+                    cursor.execute(
+                        f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id",
+                        [self.last_ids.get(table, 0)]
+                    )
+                    for row in cursor.fetchall():
+                        if len(self.values) >= settings.QUERYCRAFT_VALUE_INDEX_MAX_VALUES:
+                            break
+                        for column, value in zip(columns, row[1:]):
+                            self._add(table, column, value)
+                        self.last_ids[table] = row[0]
+                        added += 1
+
+            now = time.time()
+            self.refreshed_at = now
+            if full:
+                self.rebuilt_at = now
+        logger.info(f"Value index {'rebuilt' if full else 'refreshed'}: {added} new rows, {len(self.values)} values")
+
+    def ensure_fresh(self):
+        now = time.time()
+        if now - self.refreshed_at < settings.QUERYCRAFT_VALUE_INDEX_REFRESH:
+            return
+        self.refresh(full=now - self.rebuilt_at >= settings.QUERYCRAFT_VALUE_INDEX_REBUILD)
+
+    def resolve(self, question: str, limit: Optional[int] = None) -> List[Dict]:
+        """Stored values the question mentions, closest spellings first
+
+        A value matches when every one of its words is within a few edits of a
+        word in the question, and at least one of those words is not just a
+        number or a word every question uses. Names are often ordinary words
+        (a product called "Month"), so a one-word name only matches when the
+        question quotes or capitalizes it; one-word labels like categories
+        match as plain words.
+        """
+        if not self.enabled:
+            return []
+        try:
+            self.ensure_fresh()
+        except Exception as e:
+            # Generation works without grounding, only less reliably
+            logger.warning(f"Value index refresh failed: {str(e)}")
+            if not self.values:
+                return []
+
+        limit = limit or settings.QUERYCRAFT_VALUE_INDEX_MAX_MENTIONS
+        matched: Dict[Tuple[str, str, str], Dict[str, Tuple[str, int]]] = defaultdict(dict)
+        # Held against a concurrent refresh adding to the sets being read
+        with self.lock:
+            for question_word in set(value_words(question)):
+                candidates = self.trie.search(question_word, max_distance(question_word))
+                # A word spelled exactly like a stored one isn't a typo of some other one
+                if any(distance == 0 for _, distance in candidates):
+                    candidates = [(word, distance) for word, distance in candidates if distance == 0]
+                for word, distance in candidates:
+                    for key in self.word_values.get(word, ()):
+                        best = matched[key].get(word)
+                        if best is None or distance < best[1]:
+                            matched[key][word] = (question_word, distance)
+            value_words_by_key = {key: self.values.get(key, ()) for key in matched}
+
+        marked = marked_words(question)
+        mentions = []
+        for key, found in matched.items():
+            words = value_words_by_key[key]
+            if len(found) < len(set(words)):
+                continue
+            said = [found[word][0] for word in words]
+            if all(word in _QUESTION_WORDS or word.isdigit() or len(word) < 3 for word in said):
+                continue
+            table, column, value = key
+            if len(said) == 1 and (table, column) not in LABEL_COLUMNS and said[0] not in marked:
+                continue
+            mentions.append({
+                "table": table,
+                "column": column,
+                "value": value,
+                "mentioned_as": " ".join(said),
+                "distance": sum(distance for _, distance in found.values()),
+            })
+
+        mentions.sort(key=lambda mention: (mention["distance"], -len(mention["value"]), mention["value"]))
+        return mentions[:limit]
@@ -1,16 +1,118 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.csrf import csrf_exempt
 from django.db import connection
 import json
+import time
 import logging
 from .langgraph_agent import QueryCraftLangGraphAgent
+from .jobs import QueryJobManager, JobQueueFull
+from .conversations import CONVERSATION_ID_RE
+from .models import SavedQuery
+from .saved_queries import refresh_saved_query, saved_result, seed_saved_query
+from .targets import get_target, get_targets, UnknownTarget
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.text import slugify
 
 logger = logging.getLogger(__name__)
 
 # Create a singleton instance of the agent
 agent = QueryCraftLangGraphAgent()
 
+# Long-running questions can be handed to a bounded background pool instead of holding the request open
+job_manager = QueryJobManager(
+    agent.process_question,
+    max_workers=settings.QUERYCRAFT_JOB_WORKERS,
+    max_pending=settings.QUERYCRAFT_JOB_MAX_PENDING,
+    ttl=settings.QUERYCRAFT_JOB_TTL
+)
+
+def build_query_response(result):
+    """Shape an agent result into the API response body and status code"""
+    # Handle cases where error might be None
+    if result.get('error'):
+        return {
+            'error': result['error'],
+            'suggestion': 'Please try rephrasing your question or ask a different type of query.'
+        }, 400
+    
+    # Additional validation to ensure it's a SELECT query
+    sql_query = result.get('sql_query', '')
+    if not sql_query.strip().upper().startswith(('SELECT', 'WITH')):
+        return {
+            'error': 'Generated query is not a SELECT statement',
+            'suggestion': 'Please try rephrasing your question to ask for data retrieval only.'
+        }, 400
+    
+    response = {
+        'sql': sql_query,
+        'results': result.get('execution_result', []),
+        'validation': result.get('validation_result', 'unknown'),
+        'execution_time': result.get('execution_time', 0),
+        'tokens_used': result.get('tokens_used', 0),
+        'query_complexity': result.get('query_complexity', 'simple'),
+        'history_count': result.get('history_count', 0)
+    }
+    if result.get('target'):
+        response['target'] = result['target']
+    if result.get('rows_truncated'):
+        response['rows_truncated'] = True
+    if result.get('result_cached_at'):
+        # Rows served from the result cache can lag the database by up to QUERYCRAFT_RESULT_CACHE_TTL
+        response['cached'] = True
+        response['cached_age'] = round(max(0.0, time.time() - result['result_cached_at']), 1)
+    if result.get('candidate_report'):
+        response['candidates'] = result['candidate_report']
+    if result.get('approximation'):
+        response['approximation'] = result['approximation']
+    if result.get('conversation_id'):
+        response['conversation_id'] = result['conversation_id']
+        response['follow_up'] = result.get('follow_up')
+    if result.get('page_size'):
+        response['next_cursor'] = result.get('next_cursor')
+    return response, 200
+
+def parse_candidates(value):
+    """Validate the optional candidates count; returns (count, error response)"""
+    if value is None:
+        return None, None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None, JsonResponse({'error': 'candidates must be an integer'}, status=400)
+    if not 1 <= value <= settings.QUERYCRAFT_MAX_CANDIDATES:
+        return None, JsonResponse({'error': f'candidates must be between 1 and {settings.QUERYCRAFT_MAX_CANDIDATES}'}, status=400)
+    return value, None
+
+def parse_mode(value):
+    """Validate the optional answer mode; returns (mode, error response)"""
+    if value is None:
+        return None, None
+    if value not in ('exact', 'approximate'):
+        return None, JsonResponse({'error': "mode must be 'exact' or 'approximate'"}, status=400)
+    return value, None
+
+def parse_conversation_id(value):
+    """Validate the optional conversation id; returns (id, error response)
+
+    Turns are only remembered for clients that send an id, so one-shot
+    questions don't fill the shared cache with rows nobody will refine.
+    """
+    if value is None or value == '':
+        return None, None
+    if not isinstance(value, str) or not CONVERSATION_ID_RE.match(value):
+        return None, JsonResponse({'error': 'conversation_id must be 1-64 letters, digits, - or _'}, status=400)
+    return value, None
+
+def unknown_target_response(target):
+    """400 response when a request names a target that is not configured, otherwise None"""
+    try:
+        get_target(target)
+    except UnknownTarget as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return None
+
 def query_interface(request):
     return render(request, 'core/query.html')
 
@@ -19,45 +121,57 @@ def natural_language_query(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
+            
+            # Later pages replay the validated SQL from the cursor; no question, no model call
+            if data.get('cursor'):
+                payload, status = build_query_response(agent.fetch_page(data['cursor']))
+                return JsonResponse(payload, status=status)
+            
             question = data.get('question', '')
             logger.info(f"Question received: {question}")
 
             if not question:
                 return JsonResponse({'error': 'No question provided'}, status=400)
             
+            page_size = data.get('page_size')
+            if page_size is not None:
+                try:
+                    page_size = int(page_size)
+                except (TypeError, ValueError):
+                    return JsonResponse({'error': 'page_size must be an integer'}, status=400)
+                if not 1 <= page_size <= settings.QUERYCRAFT_MAX_PAGE_SIZE:
+                    return JsonResponse({'error': f'page_size must be between 1 and {settings.QUERYCRAFT_MAX_PAGE_SIZE}'}, status=400)
+            
+            target = data.get('target')
+            error_response = unknown_target_response(target)
+            if error_response:
+                return error_response
+            
+            candidates, error_response = parse_candidates(data.get('candidates'))
+            if error_response:
+                return error_response
+            
+            mode, error_response = parse_mode(data.get('mode'))
+            if error_response:
+                return error_response
+            if mode == 'approximate' and page_size:
+                return JsonResponse({'error': 'page_size cannot be combined with mode=approximate'}, status=400)
+            
+            conversation_id, error_response = parse_conversation_id(data.get('conversation_id'))
+            if error_response:
+                return error_response
+            
             logger.info(f"Received question: {question}")
             
             # Process question with LangGraph agent
-            result = agent.process_question(question)
+            result = agent.process_question(question, page_size=page_size, target=target, candidates=candidates,
+                                            mode=mode, conversation_id=conversation_id)
             
             logger.info(f"Generated SQL: {result.get('sql_query', 'No SQL generated')}")
             logger.info(f"Execution results: {result.get('execution_result', 'No results')}")
 
-
-            # Handle cases where error might be None
-            if result.get('error'):
-                return JsonResponse({
-                    'error': result['error'],
-                    'suggestion': 'Please try rephrasing your question or ask a different type of query.'
-                }, status=400)
-            
-            # Additional validation to ensure it's a SELECT query
-            sql_query = result.get('sql_query', '')
-            if not sql_query.strip().upper().startswith('SELECT'):
-                return JsonResponse({
-                    'error': 'Generated query is not a SELECT statement',
-                    'suggestion': 'Please try rephrasing your question to ask for data retrieval only.'
-                }, status=400)
-            
-            return JsonResponse({
-                'sql': sql_query,
-                'results': result.get('execution_result', []),
-                'validation': result.get('validation_result', 'unknown'),
-                'execution_time': result.get('execution_time', 0),
-                'tokens_used': result.get('tokens_used', 0),
-                'query_complexity': result.get('query_complexity', 'simple'),
-                'history_count': result.get('history_count', 0)
-            })
+            payload, status = build_query_response(result)
+            return JsonResponse(payload, status=status)
             
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
@@ -65,6 +179,222 @@ def natural_language_query(request):
     
     return JsonResponse({'error': 'Only POST requests are allowed'}, status=405)
 
+def format_sse(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+def query_stream(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET requests are allowed'}, status=405)
+    
+    question = request.GET.get('question', '')
+    if not question:
+        return JsonResponse({'error': 'No question provided'}, status=400)
+    
+    target = request.GET.get('target')
+    error_response = unknown_target_response(target)
+    if error_response:
+        return error_response
+    
+    candidates, error_response = parse_candidates(request.GET.get('candidates'))
+    if error_response:
+        return error_response
+    
+    mode, error_response = parse_mode(request.GET.get('mode'))
+    if error_response:
+        return error_response
+    
+    conversation_id, error_response = parse_conversation_id(request.GET.get('conversation_id'))
+    if error_response:
+        return error_response
+    
+    logger.info(f"Streaming question: {question}")
+    
+    def event_stream():
+        for event, data in agent.process_question_stream(question, target=target, candidates=candidates, mode=mode,
+                                                         conversation_id=conversation_id):
+            if event == 'result':
+                payload, status = build_query_response(data)
+                payload['status'] = status
+                yield format_sse('result', payload)
+            else:
+                yield format_sse(event, data)
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@csrf_exempt
+def query_jobs(request):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        
+        question = data.get('question', '')
+        if not question:
+            return JsonResponse({'error': 'No question provided'}, status=400)
+        
+        target = data.get('target')
+        error_response = unknown_target_response(target)
+        if error_response:
+            return error_response
+        
+        candidates, error_response = parse_candidates(data.get('candidates'))
+        if error_response:
+            return error_response
+        
+        mode, error_response = parse_mode(data.get('mode'))
+        if error_response:
+            return error_response
+        
+        conversation_id, error_response = parse_conversation_id(data.get('conversation_id'))
+        if error_response:
+            return error_response
+        
+        try:
+            job = job_manager.submit(question, target=target, candidates=candidates, mode=mode,
+                                     conversation_id=conversation_id)
+        except JobQueueFull as e:
+            return JsonResponse({'error': str(e)}, status=503)
+        
+        logger.info(f"Queued job {job['job_id']} for question: {question}")
+        job['status_url'] = f"/api/query/jobs/{job['job_id']}/"
+        return JsonResponse(job, status=202)
+    
+    return JsonResponse({'error': 'Only POST requests are allowed'}, status=405)
+
+@csrf_exempt
+def query_job_detail(request, job_id):
+    if request.method == 'GET':
+        job = job_manager.get(job_id)
+        if job is None:
+            return JsonResponse({'error': 'Job not found or expired'}, status=404)
+        
+        if job['result'] is not None:
+            job['result'], _ = build_query_response(job['result'])
+        return JsonResponse(job)
+    
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+def query_targets(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET requests are allowed'}, status=405)
+    
+    targets = []
+    for target in get_targets().values():
+        info = {
+            'name': target.name,
+            'statement_timeout': target.statement_timeout,
+            'max_rows': target.max_rows
+        }
+        try:
+            info['vendor'] = target.vendor
+            info['tables'] = sorted(target.get_tables())
+        except Exception as e:
+            info['error'] = str(e)
+        targets.append(info)
+    return JsonResponse({'targets': targets})
+
+def serialize_saved_query(saved, include_results=False):
+    data = {
+        'name': saved.name,
+        'question': saved.question,
+        'sql': saved.sql_query,
+        'target': saved.target,
+        'refresh_interval': saved.refresh_interval,
+        'refresh_strategy': saved.refresh_strategy,
+        'watermark': saved.watermark,
+        'row_count': saved.row_count,
+        'refresh_time': saved.refresh_time,
+        'last_error': saved.last_error,
+        'last_refreshed_at': saved.last_refreshed_at,
+        'next_refresh_at': saved.next_refresh_at
+    }
+    if include_results:
+        data['results'] = saved_result(saved)
+    return data
+
+@csrf_exempt
+def saved_queries(request):
+    if request.method == 'GET':
+        return JsonResponse({'saved_queries': [serialize_saved_query(saved) for saved in SavedQuery.objects.order_by('name')]})
+    
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        
+        question = data.get('question', '')
+        if not question:
+            return JsonResponse({'error': 'No question provided'}, status=400)
+        
+        name = slugify(data.get('name') or question)[:100]
+        if not name:
+            return JsonResponse({'error': 'name must contain letters or digits'}, status=400)
+        if SavedQuery.objects.filter(name=name).exists():
+            return JsonResponse({'error': f"A saved query named '{name}' already exists"}, status=409)
+        
+        try:
+            refresh_interval = int(data.get('refresh_interval', 3600))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'refresh_interval must be an integer'}, status=400)
+        if refresh_interval < 60:
+            return JsonResponse({'error': 'refresh_interval must be at least 60 seconds'}, status=400)
+        
+        target = data.get('target')
+        error_response = unknown_target_response(target)
+        if error_response:
+            return error_response
+        
+        # The question is answered once; later refreshes rerun the validated SQL without the model
+        result = agent.process_question(question, record_history=False, target=target)
+        payload, status = build_query_response(result)
+        if status != 200:
+            return JsonResponse(payload, status=status)
+        
+        saved = SavedQuery.objects.create(
+            name=name,
+            question=question,
+            sql_query=result['sql_query'],
+            target=get_target(target).name,
+            refresh_interval=refresh_interval
+        )
+        if result.get('rows_truncated') or result.get('result_cached_at'):
+            # The answer was cut to the target's row limit or came from the result cache; read it afresh
+            refresh_saved_query(saved)
+        else:
+            seed_saved_query(saved, result.get('execution_result') or [], result.get('execution_time'))
+        logger.info(f"Saved query {name}: {saved.sql_query}")
+        return JsonResponse(serialize_saved_query(saved, include_results=True), status=201)
+    
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+@csrf_exempt
+def saved_query_detail(request, name):
+    saved = SavedQuery.objects.filter(name=name).first()
+    if saved is None:
+        return JsonResponse({'error': 'Saved query not found'}, status=404)
+    
+    # GET serves the stored result without touching the database it came from
+    if request.method == 'GET':
+        return JsonResponse(serialize_saved_query(saved, include_results=True))
+    
+    if request.method == 'POST':
+        full = request.GET.get('full') == '1'
+        refresh_saved_query(saved, full=full)
+        return JsonResponse(serialize_saved_query(saved, include_results=True))
+    
+    if request.method == 'DELETE':
+        saved.delete()
+        return JsonResponse({'deleted': name})
+    
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
 @csrf_exempt
 def query_history(request):
     if request.method == 'GET':
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -58,6 +59,8 @@ DATABASES = {
         'PASSWORD': 'bitpin',
         'HOST': 'db',
         'PORT': '5432',
+        # Persistent connections keep prepared query plans (QUERYCRAFT_PARAMETERIZE_SQL) across requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
     }
 }
 
@@ -68,4 +71,107 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# QueryCraft agent
+QUERYCRAFT_USE_ROLLUPS = os.environ.get('QUERYCRAFT_USE_ROLLUPS', '1') == '1'
+QUERYCRAFT_ROLLUP_REFRESH_INTERVAL = int(os.environ.get('QUERYCRAFT_ROLLUP_REFRESH_INTERVAL', '900'))
+# 'heuristic' uses the phrase matcher only; 'linear' also fits a NumPy model on history (numpy optional)
+QUERYCRAFT_COMPLEXITY_MODEL = os.environ.get('QUERYCRAFT_COMPLEXITY_MODEL', 'heuristic')
+QUERYCRAFT_COMPLEXITY_RETRAIN_EVERY = int(os.environ.get('QUERYCRAFT_COMPLEXITY_RETRAIN_EVERY', '25'))
+QUERYCRAFT_TRUNCATION_RETRIES = int(os.environ.get('QUERYCRAFT_TRUNCATION_RETRIES', '1'))
+QUERYCRAFT_JOB_WORKERS = int(os.environ.get('QUERYCRAFT_JOB_WORKERS', '2'))
+QUERYCRAFT_JOB_MAX_PENDING = int(os.environ.get('QUERYCRAFT_JOB_MAX_PENDING', '50'))
+QUERYCRAFT_JOB_TTL = int(os.environ.get('QUERYCRAFT_JOB_TTL', '900'))
+QUERYCRAFT_MAX_PAGE_SIZE = int(os.environ.get('QUERYCRAFT_MAX_PAGE_SIZE', '1000'))
+QUERYCRAFT_CURSOR_MAX_AGE = int(os.environ.get('QUERYCRAFT_CURSOR_MAX_AGE', '3600'))
+
+# Answer cache shared by the agent: 'locmem' (one process), 'file' (every worker on the host)
+# or 'database' (every worker everywhere; run `manage.py createcachetable` once)
+QUERYCRAFT_CACHE_BACKEND = os.environ.get('QUERYCRAFT_CACHE_BACKEND', 'locmem')
+QUERYCRAFT_CACHE_MAX_BYTES = int(os.environ.get('QUERYCRAFT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+QUERYCRAFT_CACHE_MAX_ITEM_BYTES = int(os.environ.get('QUERYCRAFT_CACHE_MAX_ITEM_BYTES', str(1024 * 1024)))
+
+_QUERYCRAFT_CACHE_BACKENDS = {
+    'locmem': ('core.cache_backends.SizeAwareLocMemCache', 'querycraft'),
+    'file': ('core.cache_backends.SizeAwareFileBasedCache',
+             os.environ.get('QUERYCRAFT_CACHE_DIR', '/tmp/querycraft_cache')),
+    'database': ('core.cache_backends.SizeAwareDatabaseCache', 'querycraft_cache'),
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'querycraft': {
+        'BACKEND': _QUERYCRAFT_CACHE_BACKENDS[QUERYCRAFT_CACHE_BACKEND][0],
+        'LOCATION': _QUERYCRAFT_CACHE_BACKENDS[QUERYCRAFT_CACHE_BACKEND][1],
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('QUERYCRAFT_CACHE_MAX_ENTRIES', '5000')),
+            'MAX_BYTES': QUERYCRAFT_CACHE_MAX_BYTES,
+        },
+    },
+}
+
+QUERYCRAFT_CACHE_ALIAS = os.environ.get('QUERYCRAFT_CACHE_ALIAS', 'querycraft')
+QUERYCRAFT_SQL_CACHE_TTL = int(os.environ.get('QUERYCRAFT_SQL_CACHE_TTL', '86400'))
+QUERYCRAFT_RESULT_CACHE_TTL = int(os.environ.get('QUERYCRAFT_RESULT_CACHE_TTL', '300'))
+QUERYCRAFT_PERSIST_HISTORY = os.environ.get('QUERYCRAFT_PERSIST_HISTORY', '1') == '1'
+QUERYCRAFT_PREWARM_ON_STARTUP = os.environ.get('QUERYCRAFT_PREWARM_ON_STARTUP', '0') == '1'
+QUERYCRAFT_PREWARM_LIMIT = int(os.environ.get('QUERYCRAFT_PREWARM_LIMIT', '20'))
+QUERYCRAFT_PREWARM_CONCURRENCY = int(os.environ.get('QUERYCRAFT_PREWARM_CONCURRENCY', '2'))
+
+# Databases a question can target. 'default' is the application database; more come from the
+# QUERYCRAFT_TARGETS JSON env var, e.g. {"sales": {"ENGINE": "django.db.backends.postgresql",
+# "NAME": "sales", "HOST": "...", "STATEMENT_TIMEOUT": 30, "MAX_ROWS": 10000}}. Django keys
+# become DATABASES['target_<name>']; the QueryCraft keys below are the target's limits.
+QUERYCRAFT_TARGET_OPTIONS = ('STATEMENT_TIMEOUT', 'MAX_ROWS', 'SCHEMA_TTL', 'TABLES')
+QUERYCRAFT_TARGETS = {
+    'default': {
+        'DATABASE': 'default',
+        'STATEMENT_TIMEOUT': float(os.environ.get('QUERYCRAFT_STATEMENT_TIMEOUT', '0')),
+        'MAX_ROWS': int(os.environ.get('QUERYCRAFT_MAX_ROWS', '0')),
+    },
+}
+
+for _name, _target in json.loads(os.environ.get('QUERYCRAFT_TARGETS', '{}')).items():
+    DATABASES[f'target_{_name}'] = {'CONN_MAX_AGE': 600}
+    DATABASES[f'target_{_name}'].update({key: value for key, value in _target.items() if key not in QUERYCRAFT_TARGET_OPTIONS})
+    QUERYCRAFT_TARGETS[_name] = {key: value for key, value in _target.items() if key in QUERYCRAFT_TARGET_OPTIONS}
+
+# Lift literals out of generated SQL so one cache entry and one prepared plan serve a whole query shape
+QUERYCRAFT_PARAMETERIZE_SQL = os.environ.get('QUERYCRAFT_PARAMETERIZE_SQL', '1') == '1'
+QUERYCRAFT_MAX_PREPARED_STATEMENTS = int(os.environ.get('QUERYCRAFT_MAX_PREPARED_STATEMENTS', '100'))
+
+# Speculative generation: >1 runs that many generations in parallel and keeps the cheapest valid one
+QUERYCRAFT_CANDIDATES = int(os.environ.get('QUERYCRAFT_CANDIDATES', '1'))
+QUERYCRAFT_MAX_CANDIDATES = int(os.environ.get('QUERYCRAFT_MAX_CANDIDATES', '4'))
+QUERYCRAFT_CANDIDATE_TEMPERATURES = [
+    float(value) for value in os.environ.get('QUERYCRAFT_CANDIDATE_TEMPERATURES', '0.1,0.3,0.6').split(',')
+]
+QUERYCRAFT_CANDIDATE_GRACE = float(os.environ.get('QUERYCRAFT_CANDIDATE_GRACE', '0.5'))
+
+# Few-shot examples picked from successful history by TF-IDF similarity
+QUERYCRAFT_FEW_SHOT_K = int(os.environ.get('QUERYCRAFT_FEW_SHOT_K', '3'))
+QUERYCRAFT_FEW_SHOT_TOKENS = int(os.environ.get('QUERYCRAFT_FEW_SHOT_TOKENS', '300'))
+QUERYCRAFT_FEW_SHOT_MAX_EXAMPLES = int(os.environ.get('QUERYCRAFT_FEW_SHOT_MAX_EXAMPLES', '1000'))
+
+# mode=approximate: tables under MIN_ROWS (planner estimate) run exactly, larger ones are sampled to about SAMPLE_ROWS rows
+QUERYCRAFT_APPROXIMATE_MIN_ROWS = int(os.environ.get('QUERYCRAFT_APPROXIMATE_MIN_ROWS', '100000'))
+QUERYCRAFT_APPROXIMATE_SAMPLE_ROWS = int(os.environ.get('QUERYCRAFT_APPROXIMATE_SAMPLE_ROWS', '20000'))
+
+# Conversations: the last turn of each conversation_id, with its rows when small enough to sort/filter locally
+QUERYCRAFT_CONVERSATION_TTL = int(os.environ.get('QUERYCRAFT_CONVERSATION_TTL', '1800'))
+QUERYCRAFT_CONVERSATION_MAX_ROWS = int(os.environ.get('QUERYCRAFT_CONVERSATION_MAX_ROWS', '1000'))
+
+# Saved queries: how often the in-process scheduler looks for due refreshes, and how often incremental ones are recomputed in full
+QUERYCRAFT_SAVED_QUERY_SCHEDULER = os.environ.get('QUERYCRAFT_SAVED_QUERY_SCHEDULER', '0') == '1'
+QUERYCRAFT_SAVED_QUERY_POLL_INTERVAL = int(os.environ.get('QUERYCRAFT_SAVED_QUERY_POLL_INTERVAL', '60'))
+QUERYCRAFT_SAVED_QUERY_FULL_REFRESH = int(os.environ.get('QUERYCRAFT_SAVED_QUERY_FULL_REFRESH', '86400'))
+
+# Value index: stored product/customer names and categories that questions are matched against before generation
+QUERYCRAFT_VALUE_INDEX = os.environ.get('QUERYCRAFT_VALUE_INDEX', '1') == '1'
+QUERYCRAFT_VALUE_INDEX_REFRESH = int(os.environ.get('QUERYCRAFT_VALUE_INDEX_REFRESH', '300'))
+QUERYCRAFT_VALUE_INDEX_REBUILD = int(os.environ.get('QUERYCRAFT_VALUE_INDEX_REBUILD', '86400'))
+QUERYCRAFT_VALUE_INDEX_MAX_VALUES = int(os.environ.get('QUERYCRAFT_VALUE_INDEX_MAX_VALUES', '200000'))
+QUERYCRAFT_VALUE_INDEX_MAX_MENTIONS = int(os.environ.get('QUERYCRAFT_VALUE_INDEX_MAX_MENTIONS', '5'))
@@ -4,4 +4,19 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'querycraft.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.QUERYCRAFT_PREWARM_ON_STARTUP:
+    # Warm the answer cache for the most frequent questions while the server starts taking traffic
+    from core.prewarm import start_background_prewarm
+    from core.views import agent
+
+    start_background_prewarm(agent, settings.QUERYCRAFT_PREWARM_LIMIT, settings.QUERYCRAFT_PREWARM_CONCURRENCY)
+
+if settings.QUERYCRAFT_SAVED_QUERY_SCHEDULER:
+    # Refresh due saved queries in this process; run one scheduler per deployment, or use refresh_saved_queries --loop
+    from core.saved_queries import start_saved_query_scheduler
+
+    start_saved_query_scheduler(settings.QUERYCRAFT_SAVED_QUERY_POLL_INTERVAL)